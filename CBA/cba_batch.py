@@ -0,0 +1,96 @@
+# VuduVations CBA Batch Processing
+# Author: S Halverson @vuduvations
+# License: BSD 3-Clause
+
+'''
+Headless batch runner for the CBA metrics.
+
+Processes a folder of CSV files, for example one per business unit or client, in
+parallel worker processes without loading Dash or Plotly. Each file's assets are
+written with their CBA metrics to the assets/ subfolder of the output, and a
+summary with one row per file plus a TOTAL row is rolled up across the batch into
+the output folder itself, so no input name can overwrite it.
+
+    python cba_batch.py clients/ --output results/ --workers 8
+
+Output is Parquet when pyarrow is installed, otherwise CSV; --format picks one.
+'''
+
+import argparse
+import glob
+import importlib.util
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from cyberchoicesmb import update_cba_metrics
+
+TOTALS = ['ALE_Pre', 'ALE_Post', 'ACS', 'Savings', 'Net Savings']
+COUNTS = ['Assets', 'Go', 'No Go']
+ASSETS_FOLDER = 'assets'
+
+# Function to pick Parquet when an engine is installed
+def default_format():
+    return 'parquet' if importlib.util.find_spec('pyarrow') is not None else 'csv'
+
+# Function to write a DataFrame in the chosen format
+def write_frame(df, path, format):
+    if format == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+# Function to compute the CBA metrics of one CSV file and write them, returning its summary row
+def process_file(csv_path, output_folder, format):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    summary = {'File': name}
+    try:
+        df = update_cba_metrics(pd.read_csv(csv_path))
+        write_frame(df, os.path.join(output_folder, ASSETS_FOLDER, f"{name}.{format}"), format)
+        summary['Assets'] = len(df)
+        summary['Go'] = int((df['Decision'] == 'Go').sum())
+        summary['No Go'] = len(df) - summary['Go']
+        summary.update({column: float(df[column].sum()) for column in TOTALS})
+        summary['Error'] = None
+    except Exception as e:
+        summary['Error'] = f"{type(e).__name__}: {e}"
+    return summary
+
+# Function to process every CSV in a folder in parallel and roll up the summary
+def run_batch(input_folder, output_folder, workers=None, format=None, pattern='*.csv'):
+    format = format or default_format()
+    os.makedirs(os.path.join(output_folder, ASSETS_FOLDER), exist_ok=True)
+    files = sorted(glob.glob(os.path.join(input_folder, pattern)))
+    workers = workers or os.cpu_count()
+
+    # Hundreds of small files are handed out in chunks to keep the per-task overhead down
+    chunksize = max(1, len(files) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = list(executor.map(process_file, files, [output_folder] * len(files), [format] * len(files),
+                                 chunksize=chunksize))
+
+    summary = pd.DataFrame(rows, columns=['File'] + COUNTS + TOTALS + ['Error'])
+    total = {'File': 'TOTAL', **summary[COUNTS + TOTALS].sum()}
+    summary = pd.concat([summary, pd.DataFrame([total])], ignore_index=True)
+    # Failed files have no counts, which turns the columns into floats; keep them integers
+    summary[COUNTS] = summary[COUNTS].astype('Int64')
+    write_frame(summary, os.path.join(output_folder, f"summary.{format}"), format)
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute CBA metrics for a folder of CSV files.')
+    parser.add_argument('input', help='Folder of CBA CSV files')
+    parser.add_argument('--output', default='cba_results', help='Folder for the summary, with per-file results under assets/')
+    parser.add_argument('--workers', type=int, help='Worker processes; defaults to the CPU count')
+    parser.add_argument('--format', choices=['parquet', 'csv'], help='Output format; Parquet if pyarrow is installed')
+    parser.add_argument('--pattern', default='*.csv', help='Glob for the input files')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    summary = run_batch(args.input, args.output, args.workers, args.format, args.pattern)
+    failed = summary['Error'].notna().sum()
+    print(f"Processed {len(summary) - 1} files in {time.perf_counter() - started:.2f}s ({failed} failed)")
+    sys.exit(1 if failed else 0)
@@ -2,16 +2,103 @@
 # Author: S Halverson @vuduvations
 # License: BSD 3-Clause
 
+# Plotly, Dash and dash_bootstrap_components are imported where they are used, so scripts and
+# batch jobs that only need update_cba_metrics do not pay for loading the UI stack
 import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output, State
-import dash_bootstrap_components as dbc
 import base64
+import hashlib
+import importlib.util
 import io
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+# Function to load instrumentation.py, shared with the encryption tools at the repository root,
+# by its path rather than by adding the root to sys.path. An already loaded copy is reused, so
+# both tools record into one set of metrics
+def _load_instrumentation():
+    if 'instrumentation' not in sys.modules:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'instrumentation.py')
+        spec = importlib.util.spec_from_file_location('instrumentation', path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['instrumentation'] = module
+        spec.loader.exec_module(module)
+
+_load_instrumentation()
+from instrumentation import count, timed
+from portfolio_optimizer import efficient_frontier, optimize_portfolio
+
+CACHE_MAX_BYTES = 256 * 1024 * 1024  # Upload cache budget per process
+LARGE_PORTFOLIO = 200  # Above this many assets the charts aggregate and paginate
+TOP_N = 25  # Assets shown individually in the budget pie and heatmap of a large portfolio
+PAGE_SIZE = 50  # Assets per page of the metrics chart of a large portfolio
+SCATTER_POINTS = 2000  # Markers in the cost-effectiveness chart of a large portfolio
+REUPLOAD_MESSAGE = ("This upload is no longer in the server's cache: it was evicted, is larger than "
+                    "the cache, or was handled by another worker. Upload the file again.")
+
+# LRU cache of parsed uploads keyed on the SHA256 of the uploaded bytes. Each upload's
+# DataFrame (as Parquet, or the DataFrame itself without pyarrow) and each of its rendered
+# figures (as Plotly JSON) is a separate entry, evicted least recently used first once
+# the total size exceeds max_bytes.
+class UploadCache:
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self.size -= self._entries.popitem(last=False)[1][1]
+
+    # Cached DataFrame with the CBA metrics
+    def frame(self, digest):
+        frame = self._get((digest, 'frame'))
+        if frame is None:
+            return None
+        return pd.read_parquet(io.BytesIO(frame)) if isinstance(frame, bytes) else frame.copy()
+
+    def put_frame(self, digest, df):
+        try:
+            frame = df.to_parquet()
+            self._put((digest, 'frame'), frame, len(frame))
+        except ImportError:
+            self._put((digest, 'frame'), df.copy(), int(df.memory_usage(deep=True).sum()))
+
+    # Cached figure as a dict, which Dash sends without rebuilding the Figure object
+    def figure(self, digest, name):
+        figure = self._get((digest, name))
+        return None if figure is None else json.loads(figure)
+
+    def put_figure(self, digest, name, figure):
+        import plotly.io as pio
+
+        figure = pio.to_json(figure, validate=False)
+        self._put((digest, name), figure, len(figure))
+
+upload_cache = UploadCache()
 
 # Function to calculate ALE
 def calculate_ale(pre_aro, post_aro, pre_sle, post_sle):
@@ -29,11 +116,33 @@ def update_cba_metrics(df):
     df['Decision'] = np.where(df['Net Savings'] > 0, 'Go', 'No Go')
     return df
 
-# Interactive plot using Plotly
-def plot_interactive_cba_metrics(df):
+# Function to keep the top n assets by a column and sum the rest into one "Other" row
+def top_n_with_other(df, column, n, columns):
+    ranked = df.loc[df[column].abs().sort_values(ascending=False).index]
+    top = ranked.head(n)[['Application/Software Name'] + columns]
+    rest = ranked.iloc[n:]
+    if rest.empty:
+        return top
+    other = {'Application/Software Name': f"Other ({len(rest)} assets)", **rest[columns].sum()}
+    return pd.concat([top, pd.DataFrame([other])], ignore_index=True)
+
+# Function to count the pages of the metrics chart
+def page_count(df, page_size=PAGE_SIZE):
+    if len(df) <= LARGE_PORTFOLIO:
+        return 1
+    return -(-len(df) // page_size)
+
+# Plot for detailed metrics. Large portfolios show one page of assets, ranked by net savings
+def plot_metrics(df, page=1, page_size=PAGE_SIZE):
+    import plotly.graph_objects as go
+
     metrics = ['EF', 'Safeguard Cost', 'Pre ARO', 'Post ARO', 'Pre SLE', 'Post SLE', 'ALE_Pre', 'ALE_Post']
+    title = 'CBA Metrics by Asset'
+    if len(df) > LARGE_PORTFOLIO:
+        title += f" (page {page} of {page_count(df, page_size)}, by net savings)"
+        start = (page - 1) * page_size
+        df = df.sort_values('Net Savings', ascending=False).iloc[start:start + page_size]
 
-    # Plot for detailed metrics
     fig1 = go.Figure()
     for metric in metrics:
         fig1.add_trace(go.Bar(
@@ -46,13 +155,33 @@ def plot_interactive_cba_metrics(df):
 
     fig1.update_layout(
         barmode='group',
-        title='CBA Metrics by Asset',
+        title=title,
         xaxis_title='Application/Software Name',
         yaxis_title='Value',
         legend_title='Metric'
     )
+    return fig1
+
+# Plot for overall decision. Large portfolios show the Go/No Go counts instead of one bar per asset
+def plot_decision(df):
+    import plotly.graph_objects as go
+
+    if len(df) > LARGE_PORTFOLIO:
+        counts = df.groupby('Decision')['Net Savings'].agg(['size', 'sum']).reindex(['Go', 'No Go'], fill_value=0)
+        fig2 = go.Figure(go.Bar(
+            x=counts.index,
+            y=counts['size'],
+            marker_color=['green', 'red'],
+            hovertext=[f"Net Savings: {total:,.2f}" for total in counts['sum']]
+        ))
+        fig2.update_layout(
+            title='Overall Go/No Go Decisions',
+            xaxis_title='Decision',
+            yaxis_title='Assets',
+            showlegend=False
+        )
+        return fig2
 
-    # Plot for overall decision
     fig2 = go.Figure()
     fig2.add_trace(go.Bar(
         x=df['Application/Software Name'],
@@ -73,11 +202,39 @@ def plot_interactive_cba_metrics(df):
         ),
         showlegend=False
     )
+    return fig2
+
+# Budget allocation plot. Large portfolios keep the top assets and an "Other" slice
+def plot_budget(df, top_n=TOP_N):
+    import plotly.express as px
 
-    # Budget allocation plot
-    fig3 = px.pie(df, values='ACS', names='Application/Software Name', title='Budget Allocation for Safeguards')
+    if len(df) > LARGE_PORTFOLIO:
+        df = top_n_with_other(df, 'ACS', top_n, ['ACS'])
+    return px.pie(df, values='ACS', names='Application/Software Name', title='Budget Allocation for Safeguards')
+
+# Cost-effectiveness plot. Large portfolios plot assets ranked by net savings as WebGL markers,
+# thinned to at most SCATTER_POINTS evenly spaced ranks so the payload stays bounded
+def plot_cost_effectiveness(df, max_points=SCATTER_POINTS):
+    import plotly.graph_objects as go
+
+    if len(df) > LARGE_PORTFOLIO:
+        ranked = df.sort_values('Net Savings', ascending=False)
+        ranks = np.unique(np.linspace(0, len(ranked) - 1, min(len(ranked), max_points)).astype(int))
+        ranked = ranked.iloc[ranks]
+        fig4 = go.Figure(go.Scattergl(
+            x=ranks + 1,
+            y=ranked['Net Savings'],
+            mode='markers',
+            marker=dict(color=np.where(ranked['Net Savings'] > 0, 'green', 'red')),
+            hovertext=ranked['Application/Software Name']
+        ))
+        fig4.update_layout(
+            title='Cost Effectiveness of Safeguards',
+            xaxis_title='Asset Rank by Net Savings',
+            yaxis_title='Net Savings'
+        )
+        return fig4
 
-    # Cost-effectiveness plot
     fig4 = go.Figure()
     fig4.add_trace(go.Scatter(
         x=df['Application/Software Name'],
@@ -92,75 +249,244 @@ def plot_interactive_cba_metrics(df):
         xaxis_title='Application/Software Name',
         yaxis_title='Net Savings'
     )
+    return fig4
+
+# Heatmap for cost-benefit analysis. Large portfolios keep the top assets by net savings and an "Other" row
+def plot_heatmap(df, top_n=TOP_N):
+    import plotly.express as px
+
+    columns = ['ALE_Pre', 'ALE_Post', 'ACS', 'Net Savings']
+    if len(df) > LARGE_PORTFOLIO:
+        df = top_n_with_other(df, 'Net Savings', top_n, columns)
+    heatmap_data = df.set_index('Application/Software Name')[columns]
+    return px.imshow(heatmap_data.T, text_auto=True, aspect="auto", title='Cost-Benefit Analysis Heatmap')
+
+# Figure builders by name, so each chart can be rendered and cached on its own
+PLOTS = {
+    'metrics': plot_metrics,
+    'decision': plot_decision,
+    'budget': plot_budget,
+    'cost_effectiveness': plot_cost_effectiveness,
+    'heatmap': plot_heatmap,
+}
+
+# Efficient frontier of the best Savings per budget. It depends only on the data, so the dashboard
+# caches it per upload and only the selected portfolio is recomputed when the budget changes
+def plot_frontier(df, budget=None):
+    import plotly.graph_objects as go
+
+    frontier = efficient_frontier(df)
+    fig6 = go.Figure(go.Scatter(
+        x=frontier['Budget'],
+        y=frontier['Savings'],
+        mode='lines+markers',
+        name='Best Savings',
+        hovertext=[f"{count} safeguards" for count in frontier['Selected']]
+    ))
+    if not frontier['Exact'].all():
+        fig6.add_trace(go.Scatter(
+            x=frontier['Budget'],
+            y=frontier['Upper Bound'],
+            mode='lines',
+            line=dict(dash='dot'),
+            name='Upper Bound'
+        ))
+    fig6.update_layout(
+        title='Efficient Frontier of Safeguard Savings by Budget',
+        xaxis_title='Budget (ACS)',
+        yaxis_title='Savings'
+    )
+    return add_selected_portfolio(fig6, df, budget) if budget else fig6
+
+# Function to mark the optimal portfolio for one budget on a frontier figure
+def add_selected_portfolio(fig6, df, budget):
+    import plotly.graph_objects as go
+
+    fig6 = go.Figure(fig6)
+    selected, summary = optimize_portfolio(df, budget)
+    fig6.add_trace(go.Scatter(
+        x=[budget],
+        y=[summary['savings']],
+        mode='markers',
+        marker=dict(color='green', size=12),
+        name='Selected Portfolio',
+        hovertext=', '.join(selected['Application/Software Name'].astype(str).head(TOP_N))
+    ))
+    fig6.update_layout(title=(
+        f"Efficient Frontier of Safeguard Savings by Budget<br>{summary['selected']} safeguards for "
+        f"{summary['spent']:,.0f} save {summary['savings']:,.0f} ({'optimal' if summary['exact'] else 'greedy'})"
+    ))
+    return fig6
 
-    # Heatmap for cost-benefit analysis
-    heatmap_data = df.set_index('Application/Software Name')[['ALE_Pre', 'ALE_Post', 'ACS', 'Net Savings']]
-    fig5 = px.imshow(heatmap_data.T, text_auto=True, aspect="auto", title='Cost-Benefit Analysis Heatmap')
+# All figure builders, including those not part of plot_interactive_cba_metrics
+FIGURES = dict(PLOTS, frontier=plot_frontier)
 
+# Interactive plot using Plotly
+@timed('plot_interactive_cba_metrics')
+def plot_interactive_cba_metrics(df):
+    fig1, fig2, fig3, fig4, fig5 = (plot(df) for plot in PLOTS.values())
     return fig1, fig2, fig3, fig4, fig5
 
-# Dash app setup
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
-
-app.layout = dbc.Container([
-    dbc.Row([
-        dbc.Col(html.Img(src='assets/logo.png', height='100px'), width='auto'),
-        dbc.Col(html.H1("VuduVations CBA for the SMB- Cybersecurity Cost Benefits Analysis for Small and Medium Business"), className="text-center mt-4")
-    ]),
-    dbc.Row(dbc.Col(dcc.Upload(
-        id='upload-data',
-        children=html.Div(['Drag and Drop or ', html.A('Select a CSV File')]),
-        style={
-            'width': '100%',
-            'height': '60px',
-            'lineHeight': '60px',
-            'borderWidth': '1px',
-            'borderStyle': 'dashed',
-            'borderRadius': '5px',
-            'textAlign': 'center',
-            'margin': '10px'
-        },
-        multiple=False
-    ), className="mb-4")),
-    dbc.Row(dbc.Col(html.Div(id='output-data-upload'))),
-    dbc.Row([
-        dbc.Col(dcc.Graph(id='cba-metrics-plot', figure={}), width=6),
-        dbc.Col(dcc.Graph(id='cba-decision-plot', figure={}), width=6)
-    ]),
-    dbc.Row([
-        dbc.Col(dcc.Graph(id='budget-allocation-plot', figure={}), width=6),
-        dbc.Col(dcc.Graph(id='cost-effectiveness-plot', figure={}), width=6)
-    ]),
-    dbc.Row(dbc.Col(dcc.Graph(id='cost-benefit-heatmap', figure={}), width=12))
-], style={'backgroundColor': 'white'})  # Set background to white
-
-def parse_contents(contents, filename):
+# Size of an upload for the instrumentation byte counters
+def upload_size(result, contents, *args, **kwargs):
+    return len(contents)
+
+# Function to parse an upload into upload_cache, unless the same bytes were uploaded before
+@timed('load_upload', size=upload_size)
+def load_upload(contents):
     content_type, content_string = contents.split(',')
     decoded = base64.b64decode(content_string)
-    try:
-        if 'csv' in filename:
-            df = pd.read_csv(io.StringIO(decoded.decode('utf-8')))
-            df = update_cba_metrics(df)
-            fig1, fig2, fig3, fig4, fig5 = plot_interactive_cba_metrics(df)
-            return fig1, fig2, fig3, fig4, fig5
-    except Exception as e:
-        print(e)
-        return {}, {}, {}, {}, {}
-
-@app.callback(
-    [Output('cba-metrics-plot', 'figure'),
-     Output('cba-decision-plot', 'figure'),
-     Output('budget-allocation-plot', 'figure'),
-     Output('cost-effectiveness-plot', 'figure'),
-     Output('cost-benefit-heatmap', 'figure')],
-    [Input('upload-data', 'contents')],
-    [State('upload-data', 'filename')]
-)
+    digest = hashlib.sha256(decoded).hexdigest()
+    df = upload_cache.frame(digest)
+    if df is None:
+        df = pd.read_csv(io.BytesIO(decoded))
+        df = update_cba_metrics(df)
+        upload_cache.put_frame(digest, df)
+    return digest, df
+
+# Function to build an empty chart that shows a message in place of the data
+def message_figure(text):
+    return {
+        'data': [],
+        'layout': {
+            'xaxis': {'visible': False},
+            'yaxis': {'visible': False},
+            'annotations': [{'text': text, 'showarrow': False, 'xref': 'paper', 'yref': 'paper',
+                             'x': 0.5, 'y': 0.5, 'font': {'size': 14}}]
+        }
+    }
+
+# Function to render one chart of a cached upload, reusing its cached figure when there is one
+@timed('render_figure')
+def render_figure(digest, name, **options):
+    key = name + ''.join(f":{option}={value}" for option, value in sorted(options.items()))
+    figure = upload_cache.figure(digest, key)
+    if figure is None:
+        df = upload_cache.frame(digest)
+        if df is None:
+            # Tell the user rather than leave the chart blank
+            count('render_figure_cache_misses_total')
+            return message_figure(REUPLOAD_MESSAGE)
+        figure = FIGURES[name](df, **options)
+        upload_cache.put_figure(digest, key, figure)
+    return figure
+
+# Callbacks. The upload callback only parses and caches the data; each chart then renders in
+# its own callback, so charts arrive independently and paging re-renders only the metrics chart
 def update_output(contents, filename):
-    if contents is not None:
-        fig1, fig2, fig3, fig4, fig5 = parse_contents(contents, filename)
-        return fig1, fig2, fig3, fig4, fig5
-    return {}, {}, {}, {}, {}
+    if contents is not None and 'csv' in filename:
+        try:
+            digest, df = load_upload(contents)
+            return digest, page_count(df), 1
+        except Exception as e:
+            count('update_output_errors_total')
+            print(e)
+    return None, 1, 1
+
+def update_metrics_plot(digest, page):
+    return render_figure(digest, 'metrics', page=page or 1) if digest else {}
+
+def update_decision_plot(digest):
+    return render_figure(digest, 'decision') if digest else {}
+
+def update_budget_plot(digest):
+    return render_figure(digest, 'budget') if digest else {}
+
+def update_cost_effectiveness_plot(digest):
+    return render_figure(digest, 'cost_effectiveness') if digest else {}
+
+def update_heatmap(digest):
+    return render_figure(digest, 'heatmap') if digest else {}
+
+def update_frontier_plot(digest, budget):
+    if not digest:
+        return {}
+    figure = render_figure(digest, 'frontier')
+    if not budget:
+        return figure
+    df = upload_cache.frame(digest)
+    if df is None:
+        return figure  # Already the re-upload message
+    return add_selected_portfolio(figure, df, budget)
+
+# Dash app setup, built on demand so importing this module stays headless
+def create_app():
+    import dash
+    from dash import dcc, html
+    from dash.dependencies import Input, Output, State
+    import dash_bootstrap_components as dbc
+
+    app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+
+    app.layout = dbc.Container([
+        dbc.Row([
+            dbc.Col(html.Img(src='assets/logo.png', height='100px'), width='auto'),
+            dbc.Col(html.H1("VuduVations CBA for the SMB- Cybersecurity Cost Benefits Analysis for Small and Medium Business"), className="text-center mt-4")
+        ]),
+        dbc.Row(dbc.Col(dcc.Upload(
+            id='upload-data',
+            children=html.Div(['Drag and Drop or ', html.A('Select a CSV File')]),
+            style={
+                'width': '100%',
+                'height': '60px',
+                'lineHeight': '60px',
+                'borderWidth': '1px',
+                'borderStyle': 'dashed',
+                'borderRadius': '5px',
+                'textAlign': 'center',
+                'margin': '10px'
+            },
+            multiple=False
+        ), className="mb-4")),
+        dcc.Store(id='upload-key'),  # Content hash of the current upload in upload_cache
+        dbc.Row(dbc.Col(html.Div(id='output-data-upload'))),
+        dbc.Row([
+            dbc.Col([
+                dcc.Graph(id='cba-metrics-plot', figure={}),
+                dbc.Pagination(id='asset-page', max_value=1, active_page=1, fully_expanded=False, size='sm')
+            ], width=6),
+            dbc.Col(dcc.Graph(id='cba-decision-plot', figure={}), width=6)
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Graph(id='budget-allocation-plot', figure={}), width=6),
+            dbc.Col(dcc.Graph(id='cost-effectiveness-plot', figure={}), width=6)
+        ]),
+        dbc.Row(dbc.Col(dcc.Graph(id='cost-benefit-heatmap', figure={}), width=12)),
+        dbc.Row(dbc.Col([
+            dcc.Input(id='safeguard-budget', type='number', min=0, debounce=True,
+                      placeholder='Safeguard budget (ACS)'),
+            dcc.Graph(id='portfolio-frontier-plot', figure={})
+        ], width=12))
+    ], style={'backgroundColor': 'white'})  # Set background to white
+
+    app.callback(
+        [Output('upload-key', 'data'),
+         Output('asset-page', 'max_value'),
+         Output('asset-page', 'active_page')],
+        [Input('upload-data', 'contents')],
+        [State('upload-data', 'filename')]
+    )(update_output)
+    app.callback(Output('cba-metrics-plot', 'figure'),
+                 [Input('upload-key', 'data'), Input('asset-page', 'active_page')])(update_metrics_plot)
+    app.callback(Output('cba-decision-plot', 'figure'), [Input('upload-key', 'data')])(update_decision_plot)
+    app.callback(Output('budget-allocation-plot', 'figure'), [Input('upload-key', 'data')])(update_budget_plot)
+    app.callback(Output('cost-effectiveness-plot', 'figure'),
+                 [Input('upload-key', 'data')])(update_cost_effectiveness_plot)
+    app.callback(Output('cost-benefit-heatmap', 'figure'), [Input('upload-key', 'data')])(update_heatmap)
+    app.callback(Output('portfolio-frontier-plot', 'figure'),
+                 [Input('upload-key', 'data'), Input('safeguard-budget', 'value')])(update_frontier_plot)
+    return app
+
+_app = None
+
+# Deployments that import `app` or `server` from this module still get the dashboard, built on first access
+def __getattr__(name):
+    global _app
+    if name in ('app', 'server'):
+        if _app is None:
+            _app = create_app()
+        return _app if name == 'app' else _app.server
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    create_app().run_server(debug=True)
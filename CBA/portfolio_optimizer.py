@@ -0,0 +1,282 @@
+# VuduVations CBA Safeguard Portfolio Optimizer
+# Author: S Halverson @vuduvations
+# License: BSD 3-Clause
+
+'''
+Budget-constrained selection of safeguards for the CBA tool.
+
+update_cba_metrics decides Go/No Go per row. Given a fixed budget, the real question
+is which safeguards to fund together: the subset that maximizes total Savings with
+its total ACS within the budget (a 0/1 knapsack).
+
+* dp: exact dynamic programming over costs in whole `resolution` units (dollars by
+  default). Used when every cost is a whole number of units and the table fits in
+  DP_CELLS. One table gives the optimum at every budget up to the largest.
+* bnb: exact branch-and-bound with the LP-relaxation bound, for up to BNB_ITEMS
+  candidates. It stops after max_nodes and then reports the best set found.
+* greedy: savings-per-cost order, compared with the best single safeguard. Runs in
+  milliseconds for thousands of candidates and reports the LP upper bound, so the
+  gap to the optimum is known.
+
+Safeguards without positive Savings are never selected. Ones with positive Savings
+and no cost are always selected.
+
+    python portfolio_optimizer.py assets.csv --budget 25000
+'''
+
+import argparse
+import bisect
+
+import numpy as np
+import pandas as pd
+
+DP_CELLS = 50_000_000  # Items x budget units in the DP table (one byte each)
+BNB_ITEMS = 100
+MAX_NODES = 500_000
+FRONTIER_LEVELS = 20
+
+# Function to compute the LP-relaxation bound: items by ratio, the last one taken fractionally
+def lp_bound(costs, values, budget):
+    order = np.argsort(-(values / costs), kind='stable')
+    cumulative = np.cumsum(costs[order])
+    whole = int(np.searchsorted(cumulative, budget, side='right'))
+    bound = values[order][:whole].sum()
+    if whole < len(order):
+        spent = cumulative[whole - 1] if whole else 0.0
+        bound += (budget - spent) / costs[order[whole]] * values[order[whole]]
+    return float(bound)
+
+# Function to pick by savings per cost, keeping the best single safeguard if it beats the greedy set
+def greedy(costs, values, budget):
+    chosen = np.zeros(len(costs), dtype=bool)
+    remaining = budget
+    for i in np.argsort(-(values / costs), kind='stable'):
+        if costs[i] <= remaining:
+            chosen[i] = True
+            remaining -= costs[i]
+
+    affordable = np.flatnonzero(costs <= budget)
+    if len(affordable):
+        best = affordable[np.argmax(values[affordable])]
+        if values[best] > values[chosen].sum():
+            chosen[:] = False
+            chosen[best] = True
+    return chosen
+
+# Function to search exactly with branch-and-bound; returns the selection and whether it finished
+def branch_and_bound(costs, values, budget, max_nodes=MAX_NODES):
+    order = np.argsort(-(values / costs), kind='stable')
+    cost = costs[order].tolist()
+    value = values[order].tolist()
+    n = len(cost)
+    prefix_cost = np.concatenate([[0.0], np.cumsum(cost)]).tolist()
+    prefix_value = np.concatenate([[0.0], np.cumsum(value)]).tolist()
+
+    def bound(i, capacity):
+        # Take items i.. whole while they fit, then a fraction of the next one
+        k = bisect.bisect_right(prefix_cost, prefix_cost[i] + capacity) - 1
+        total = prefix_value[k] - prefix_value[i]
+        if k < n:
+            total += (capacity - (prefix_cost[k] - prefix_cost[i])) / cost[k] * value[k]
+        return total
+
+    incumbent = greedy(costs, values, budget)[order]
+    best_value = float(values[order][incumbent].sum())
+    best_taken = incumbent.tolist()
+
+    nodes = 0
+    taken = [False] * n
+    stack = [(0, budget, 0.0, False)]  # (item, capacity left, value so far, take item-1)
+    while stack:
+        nodes += 1
+        if nodes > max_nodes:
+            break
+        i, capacity, total, take = stack.pop()
+        if i:
+            taken[i - 1] = take
+        if total > best_value:
+            best_value, best_taken = total, taken[:i] + [False] * (n - i)
+        if i == n or total + bound(i, capacity) <= best_value:
+            continue
+        # Push the skip branch first so the take branch is explored first
+        stack.append((i + 1, capacity, total, False))
+        if cost[i] <= capacity:
+            stack.append((i + 1, capacity - cost[i], total + value[i], True))
+
+    chosen = np.zeros(n, dtype=bool)
+    chosen[order] = best_taken
+    return chosen, nodes <= max_nodes
+
+# Function to fill the exact DP table over integer costs; best[c] is the optimum within c units
+def dp_table(units, values, capacity):
+    best = np.zeros(capacity + 1)
+    keep = np.zeros((len(units), capacity + 1), dtype=bool)
+    for i, (weight, value) in enumerate(zip(units, values)):
+        if weight > capacity:
+            continue
+        candidate = best[:capacity + 1 - weight] + value
+        improve = candidate > best[weight:]
+        keep[i, weight:] = improve
+        best[weight:] = np.where(improve, candidate, best[weight:])
+    return best, keep
+
+# Function to read the selection for a capacity back out of the DP table
+def dp_backtrack(keep, units, capacity):
+    chosen = np.zeros(len(units), dtype=bool)
+    for i in range(len(units) - 1, -1, -1):
+        if keep[i, capacity]:
+            chosen[i] = True
+            capacity -= units[i]
+    return chosen
+
+def _candidates(df):
+    costs = df['ACS'].to_numpy(dtype=float)
+    values = df['Savings'].to_numpy(dtype=float)
+    free = np.flatnonzero((values > 0) & (costs <= 0))
+    paid = np.flatnonzero((values > 0) & (costs > 0))
+    return free, paid, costs[paid], values[paid]
+
+def _dp_units(costs, budget, resolution):
+    units = costs / resolution
+    capacity = int(np.floor(budget / resolution + 1e-9))
+    # Absolute tolerance only: a relative one would round large fractional costs like 250000.5
+    if not np.allclose(units, np.round(units), rtol=0, atol=1e-9) or (len(units) * (capacity + 1)) > DP_CELLS:
+        return None, capacity
+    return np.round(units).astype(np.int64), capacity
+
+def _pick_method(method, costs, budget, resolution):
+    units, capacity = _dp_units(costs, budget, resolution)
+    if method == 'auto':
+        if units is not None:
+            return 'dp', units, capacity
+        return ('bnb' if len(costs) <= BNB_ITEMS else 'greedy'), None, capacity
+    if method == 'dp' and units is None:
+        raise ValueError(f"DP needs whole multiples of {resolution} and at most {DP_CELLS} table cells")
+    if method not in ('dp', 'bnb', 'greedy'):
+        raise ValueError(f"Unknown method: {method}")
+    return method, units, capacity
+
+def _summary(df, selected, budget, method, exact, upper_bound, candidates):
+    spent = float(df['ACS'].iloc[selected].sum())
+    savings = float(df['Savings'].iloc[selected].sum())
+    return {
+        'method': method,
+        'exact': exact,
+        'budget': budget,
+        'spent': spent,
+        'savings': savings,
+        'net_savings': savings - spent,
+        'selected': len(selected),
+        'candidates': candidates,
+        'upper_bound': upper_bound,
+    }
+
+def optimize_portfolio(df, budget, method='auto', resolution=1.0, max_nodes=MAX_NODES):
+    """
+    Picks the safeguards that maximize total Savings with total ACS within the budget.
+
+    Args:
+        df (DataFrame): The CBA data with the ACS and Savings columns of update_cba_metrics.
+        budget (float): The maximum total ACS.
+        method (str): 'auto', 'dp', 'bnb' or 'greedy'. 'auto' uses dp when the costs fit it,
+            bnb for up to BNB_ITEMS candidates and greedy beyond.
+        resolution (float): The cost unit of the DP table.
+        max_nodes (int): The node limit of branch-and-bound.
+
+    Returns:
+        tuple: (selected, summary). selected holds the chosen rows of df. summary holds the
+        method, whether the result is proven optimal, the budget, spent, savings, net savings,
+        the number selected and of candidates, and the LP upper bound on the savings.
+    """
+    free, paid, costs, values = _candidates(df)
+    method, units, capacity = _pick_method(method, costs, budget, resolution)
+    affordable = costs <= budget
+
+    if method == 'dp':
+        _, keep = dp_table(units, values, capacity)
+        chosen, exact = dp_backtrack(keep, units, capacity), True
+    elif method == 'bnb':
+        chosen, exact = branch_and_bound(costs, values, budget, max_nodes)
+    else:
+        chosen, exact = greedy(costs, values, budget), False
+
+    upper_bound = float(values[free].sum() if len(free) else 0.0) + \
+        lp_bound(costs[affordable], values[affordable], budget)
+    selected = np.sort(np.concatenate([free, paid[chosen]]))
+    summary = _summary(df, selected, budget, method, exact, upper_bound, len(free) + len(paid))
+    return df.iloc[selected], summary
+
+def efficient_frontier(df, budgets=None, levels=FRONTIER_LEVELS, method='auto', resolution=1.0,
+                       max_nodes=MAX_NODES):
+    """
+    Computes the best achievable Savings across budget levels.
+
+    With the dp method a single table covers every level. When the costs do not fit dp,
+    'auto' uses greedy at each level rather than one branch-and-bound search per level, and
+    the LP upper bound per level shows how far from the optimum each point can be. Use
+    optimize_portfolio for an exact answer at a single budget.
+
+    Args:
+        df (DataFrame): The CBA data with the ACS and Savings columns of update_cba_metrics.
+        budgets (iterable): The budget levels. Defaults to levels evenly spaced steps up to
+            the cost of every candidate.
+        levels (int): The number of default budget levels.
+        method (str): As for optimize_portfolio, chosen once for the largest budget, except
+            that 'auto' never picks bnb.
+        resolution (float): The cost unit of the DP table.
+        max_nodes (int): The node limit of branch-and-bound.
+
+    Returns:
+        DataFrame: One row per budget with Budget, Spent, Savings, Net Savings, Selected, Method,
+        Exact and Upper Bound.
+    """
+    free, paid, costs, values = _candidates(df)
+    if budgets is None:
+        budgets = np.linspace(0, costs.sum(), levels + 1)[1:] if len(costs) else [0.0]
+    budgets = sorted(float(budget) for budget in budgets)
+    auto = method == 'auto'
+    method, units, capacity = _pick_method(method, costs, budgets[-1], resolution)
+    if auto and method == 'bnb':
+        method = 'greedy'
+    free_savings = float(values[free].sum() if len(free) else 0.0)
+
+    if method == 'dp':
+        _, keep = dp_table(units, values, capacity)
+
+    rows = []
+    for budget in budgets:
+        if method == 'dp':
+            level = min(capacity, int(np.floor(budget / resolution + 1e-9)))
+            chosen, exact = dp_backtrack(keep, units, level), True
+        elif method == 'bnb':
+            chosen, exact = branch_and_bound(costs, values, budget, max_nodes)
+        else:
+            chosen, exact = greedy(costs, values, budget), False
+        selected = np.concatenate([free, paid[chosen]])
+        affordable = costs <= budget
+        upper_bound = free_savings + lp_bound(costs[affordable], values[affordable], budget)
+        summary = _summary(df, selected, budget, method, exact, upper_bound, len(free) + len(paid))
+        rows.append({'Budget': budget, 'Spent': summary['spent'], 'Savings': summary['savings'],
+                     'Net Savings': summary['net_savings'], 'Selected': summary['selected'],
+                     'Method': method, 'Exact': exact, 'Upper Bound': upper_bound})
+    return pd.DataFrame(rows)
+
+if __name__ == '__main__':
+    from cyberchoicesmb import update_cba_metrics
+
+    parser = argparse.ArgumentParser(description='Pick the safeguards to fund under a budget.')
+    parser.add_argument('csv', help='CBA data')
+    parser.add_argument('--budget', type=float, required=True, help='Maximum total ACS')
+    parser.add_argument('--method', choices=['auto', 'dp', 'bnb', 'greedy'], default='auto')
+    parser.add_argument('--frontier', action='store_true', help='Also print the efficient frontier')
+    args = parser.parse_args()
+
+    df = update_cba_metrics(pd.read_csv(args.csv))
+    selected, summary = optimize_portfolio(df, args.budget, args.method)
+    print(selected[['Application/Software Name', 'ACS', 'Savings']].to_string(index=False))
+    print(f"{summary['method']} ({'optimal' if summary['exact'] else 'heuristic'}): "
+          f"{summary['selected']} of {summary['candidates']} safeguards, spent {summary['spent']:,.2f} "
+          f"of {summary['budget']:,.2f}, savings {summary['savings']:,.2f} "
+          f"(upper bound {summary['upper_bound']:,.2f})")
+    if args.frontier:
+        print(efficient_frontier(df, method=args.method).to_string(index=False))
@@ -1,8 +1,9 @@
 '''
-Takes a predefined list of words.
-Appends numerical suffixes (00 to 09) to each word.
-Prepends special characters (! and @) to each formatted word.
-Writes the resulting formatted words to a file named formatted_words.lst.
+Streams password candidates built from base words and transformation rules.
+
+By default it takes the predefined list of words, appends numerical suffixes
+(00 to 09) to each word, prepends special characters (! and @) to each formatted
+word and writes the results to a file named formatted_words.lst.
 
 Produces:
 !protected00
@@ -12,8 +13,43 @@ Produces:
 ...
 !ultricies09
 @ultricies09
+
+Larger runs can read base words from dictionary files and combine arbitrary
+prefix, suffix, case and leet rules. Candidates are generated lazily and
+streamed through a large write buffer, so memory use stays constant no matter
+how many are produced. With --workers the product is sharded by word across
+processes, each writing its own output file:
+
+    python basicpwdgen.py --words rockyou.txt --prefix ! @ # --suffix-range 0 999 \
+        --case asis capitalize --leet --workers 8 --output candidates.lst
+
+Overlapping dictionaries produce duplicate candidates. --dedup sort removes them
+exactly with an external sort-merge through temporary run files (the output comes
+out sorted); --dedup bloom keeps the generation order and uses a fixed-size Bloom
+filter, at the cost of dropping roughly --bloom-error of the unique candidates.
+When deduplicating with several workers, every worker generates the full product
+and keeps the candidates whose hash falls in its shard, so identical candidates
+always land in the same shard whichever words and rules produced them.
+
+--format gzip or zstd compresses the output (zstd needs the zstandard package);
+--format binary writes each candidate as a 2-byte big-endian length followed by
+its UTF-8 bytes, which read_binary streams back. Candidates longer than 65535
+bytes are rejected in binary format.
 '''
 
+import argparse
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import math
+import os
+import struct
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
 words = [
     "protected", "Research", "Oxytocin", "Paracetamol", "Cortisol", "appointment", "Cardiology", "February", "providing",
     "treatment", "commonly", "hospital", "Template", "tooplate", "Pregnancy", "Saturday", "Copyright", "Laboratory",
@@ -30,12 +66,402 @@ words = [
     "ultricies"
 ]
 
-formatted_words = []
+PREFIXES = ['!', '@']
+SUFFIXES = [f"{num:02d}" for num in range(10)]
+CASES = {
+    'asis': lambda word: word,
+    'lower': str.lower,
+    'upper': str.upper,
+    'capitalize': str.capitalize,
+    'swapcase': str.swapcase,
+}
+LEET = str.maketrans({'a': '4', 'A': '4', 'e': '3', 'E': '3', 'i': '1', 'I': '1',
+                      'o': '0', 'O': '0', 's': '5', 'S': '5', 't': '7', 'T': '7'})
+WRITE_BUFFER = 8 * 1024 * 1024  # Bytes buffered before each write to disk
+BATCH_LINES = 65536  # Candidates joined per write call
+FORMATS = ['text', 'gzip', 'zstd', 'binary']
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+LENGTH = struct.Struct('>H')
+MAX_BINARY_LENGTH = 2 ** (8 * LENGTH.size) - 1
+BLOOM_CAPACITY = 10_000_000
+BLOOM_ERROR = 0.001
+SORT_RUN_LINES = 2_000_000  # Candidates sorted in memory per temporary run
+
+def load_words(paths, encoding='utf-8'):
+    '''
+    Lazily reads base words from dictionary files, one word per line.
+
+    Args:
+        paths (list): The paths to the dictionary files.
+        encoding (str): The file encoding. Undecodable bytes are skipped.
+
+    Yields:
+        str: Each non-empty word.
+    '''
+    for path in paths:
+        with open(path, encoding=encoding, errors='ignore') as f:
+            for line in f:
+                word = line.rstrip('\r\n')
+                if word:
+                    yield word
+
+def word_variants(word, cases=('asis',), leet=False):
+    '''
+    Applies the case and leet rules to a single base word.
+
+    Args:
+        word (str): The base word.
+        cases (iterable): Keys of CASES to apply.
+        leet (bool): Also emit the leet-substituted form of every case variant.
+
+    Returns:
+        list: The distinct variants, in rule order.
+    '''
+    variants = []
+    for case in cases:
+        variant = CASES[case](word)
+        forms = (variant, variant.translate(LEET)) if leet else (variant,)
+        for form in forms:
+            if form not in variants:
+                variants.append(form)
+    return variants
+
+def generate_candidates(words, prefixes=PREFIXES, suffixes=SUFFIXES, cases=('asis',), leet=False):
+    '''
+    Lazily generates the product of words, case/leet variants, suffixes and prefixes.
+
+    Candidates come out word by word, then suffix by suffix, then prefix by prefix,
+    matching the order of the original wordlist.
+
+    Args:
+        words (iterable): The base words. May be a generator over huge dictionaries.
+        prefixes (list): Strings prepended to each candidate.
+        suffixes (list): Strings appended to each candidate.
+        cases (iterable): Keys of CASES to apply.
+        leet (bool): Also emit leet-substituted forms.
+
+    Yields:
+        str: Each candidate.
+    '''
+    prefixes = list(prefixes) or ['']
+    suffixes = list(suffixes) or ['']
+    cases = tuple(cases)
+    for word in words:
+        for variant in word_variants(word, cases, leet):
+            for suffix in suffixes:
+                for prefix in prefixes:
+                    yield f"{prefix}{variant}{suffix}"
+
+class BloomFilter:
+    '''
+    A fixed-size Bloom filter over strings.
+
+    The bit array is sized from the expected number of items and the acceptable
+    false-positive rate, and never grows.
+
+    Args:
+        capacity (int): The expected number of distinct items.
+        error_rate (float): The acceptable false-positive rate at that capacity.
+    '''
+
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, item):
+        '''
+        Adds an item.
+
+        Args:
+            item (str): The item to add.
+
+        Returns:
+            bool: True if the item was not (probably) present before.
+        '''
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        # Double hashing derives all the bit positions from one digest
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        bits = self.bits
+        new = False
+        for i in range(self.hashes):
+            position = (first + i * second) % self.size
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+        return new
+
+def dedup_bloom(candidates, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR):
+    '''
+    Drops repeated candidates with a Bloom filter, keeping the generation order.
+
+    Memory is fixed by capacity and error_rate. A false positive drops a unique
+    candidate, so about error_rate of them are lost once capacity is reached.
+
+    Args:
+        candidates (iterable): The candidates.
+        capacity (int): The expected number of distinct candidates.
+        error_rate (float): The acceptable false-positive rate.
+
+    Yields:
+        str: Each candidate not seen before.
+    '''
+    seen = BloomFilter(capacity, error_rate)
+    for candidate in candidates:
+        if seen.add(candidate):
+            yield candidate
+
+def _read_run(path):
+    # newline='\n' keeps a bare '\r' inside a candidate instead of splitting on it
+    with open(path, encoding='utf-8', newline='\n', buffering=WRITE_BUFFER // 16) as f:
+        for line in f:
+            yield line[:-1]
+
+def dedup_sorted(candidates, run_lines=SORT_RUN_LINES, tmpdir=None):
+    '''
+    Drops repeated candidates exactly with an external sort-merge.
+
+    Candidates are sorted in runs of run_lines, each run is written to a temporary
+    file, and the runs are merged lazily, so memory is bounded by run_lines.
+
+    Args:
+        candidates (iterable): The candidates. They must not contain newlines.
+        run_lines (int): The number of candidates sorted in memory at once.
+        tmpdir (str): Where to put the run files. Defaults to the system temp folder.
+
+    Yields:
+        str: Each distinct candidate, in sorted order.
+    '''
+    candidates = iter(candidates)
+    with tempfile.TemporaryDirectory(prefix='vv_wordlist_', dir=tmpdir) as scratch:
+        runs = []
+        while True:
+            run = sorted(set(itertools.islice(candidates, run_lines)))
+            if not run:
+                break
+            path = os.path.join(scratch, f'run{len(runs)}')
+            with open(path, 'w', encoding='utf-8', newline='\n', buffering=WRITE_BUFFER) as f:
+                f.write('\n'.join(run))
+                f.write('\n')
+            runs.append(path)
+
+        previous = None
+        for candidate in heapq.merge(*(_read_run(path) for path in runs)):
+            if candidate != previous:
+                yield candidate
+                previous = candidate
+
+def deduplicate(candidates, method=None, bloom_capacity=BLOOM_CAPACITY, bloom_error=BLOOM_ERROR,
+                tmpdir=None):
+    '''
+    Applies the chosen dedup stage, if any.
+
+    Args:
+        candidates (iterable): The candidates.
+        method (str): None, 'sort' or 'bloom'.
+        bloom_capacity (int): The expected number of distinct candidates, for 'bloom'.
+        bloom_error (float): The acceptable false-positive rate, for 'bloom'.
+        tmpdir (str): Where to put the run files, for 'sort'.
+
+    Returns:
+        iterable: The deduplicated candidates.
+    '''
+    if method == 'sort':
+        return dedup_sorted(candidates, tmpdir=tmpdir)
+    if method == 'bloom':
+        return dedup_bloom(candidates, bloom_capacity, bloom_error)
+    if method:
+        raise ValueError(f"Unknown dedup method: {method}")
+    return candidates
+
+def open_output(output_path, format='text', buffer_size=WRITE_BUFFER):
+    '''
+    Opens a wordlist file for writing in one of FORMATS.
+
+    Args:
+        output_path (str): The path to the output file.
+        format (str): One of FORMATS.
+        buffer_size (int): The size of the write buffer in bytes.
+
+    Returns:
+        file: A text file, or a binary file for 'binary'.
+
+    Raises:
+        ImportError: If zstd output is requested without the zstandard package.
+    '''
+    if format == 'text':
+        return open(output_path, 'w', buffering=buffer_size)
+    if format == 'binary':
+        return open(output_path, 'wb', buffering=buffer_size)
+    if format == 'gzip':
+        compressed = gzip.GzipFile(output_path, 'wb', compresslevel=GZIP_LEVEL)
+        return io.TextIOWrapper(io.BufferedWriter(compressed, buffer_size), encoding='utf-8')
+    if format == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd output needs the zstandard package: pip install zstandard")
+        raw = open(output_path, 'wb', buffering=buffer_size)
+        writer = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw)
+        return io.TextIOWrapper(writer, encoding='utf-8', write_through=True)
+    raise ValueError(f"Unknown output format: {format}")
+
+def write_candidates(candidates, output_path, buffer_size=WRITE_BUFFER, format='text'):
+    '''
+    Streams candidates to a file through a large write buffer.
+
+    Text formats put one candidate per line; 'binary' length-prefixes each one.
+
+    Raises:
+        ValueError: If a candidate is longer than MAX_BINARY_LENGTH bytes in 'binary' format.
+
+    Args:
+        candidates (iterable): The candidates to write.
+        output_path (str): The path to the output file.
+        buffer_size (int): The size of the write buffer in bytes.
+        format (str): One of FORMATS.
+
+    Returns:
+        int: The number of candidates written.
+    '''
+    candidates = iter(candidates)
+    count = 0
+    with open_output(output_path, format, buffer_size) as file:
+        while True:
+            batch = list(itertools.islice(candidates, BATCH_LINES))
+            if not batch:
+                break
+            if format == 'binary':
+                encoded = [candidate.encode('utf-8') for candidate in batch]
+                longest = max(encoded, key=len)
+                if len(longest) > MAX_BINARY_LENGTH:
+                    raise ValueError(f"Candidate of {len(longest)} bytes is too long for the binary format "
+                                     f"(at most {MAX_BINARY_LENGTH})")
+                file.write(b''.join(LENGTH.pack(len(data)) + data for data in encoded))
+            else:
+                # Lines are separated rather than terminated, like the original wordlist
+                file.write(('\n' if count else '') + '\n'.join(batch))
+            count += len(batch)
+    return count
+
+def read_binary(path, buffer_size=WRITE_BUFFER):
+    '''
+    Streams candidates back from a length-prefixed binary wordlist.
+
+    Args:
+        path (str): The path to the binary wordlist.
+        buffer_size (int): The size of the read buffer in bytes.
+
+    Yields:
+        str: Each candidate.
+    '''
+    with open(path, 'rb', buffering=buffer_size) as f:
+        while True:
+            prefix = f.read(LENGTH.size)
+            if not prefix:
+                return
+            (length,) = LENGTH.unpack(prefix)
+            yield f.read(length).decode('utf-8')
+
+def shard_path(output_path, shard, shards):
+    '''
+    Names the output file of one shard, e.g. words.lst -> words.part3of8.lst.
+    '''
+    stem, dot, extension = output_path.rpartition('.')
+    if not dot:
+        return f"{output_path}.part{shard}of{shards}"
+    return f"{stem}.part{shard}of{shards}.{extension}"
+
+def _shard_candidates(candidates, shard, shards):
+    # Hashing the final candidate keeps every copy of it in one shard, however it was produced
+    return (candidate for candidate in candidates if zlib.crc32(candidate.encode('utf-8')) % shards == shard)
+
+def _write_shard(word_files, shard, shards, output_path, prefixes, suffixes, cases, leet, dedup, dedup_options,
+                 format):
+    source = load_words(word_files) if word_files else words
+    # Every worker reads the dictionaries itself and keeps only its own share
+    if dedup:
+        candidates = generate_candidates(source, prefixes, suffixes, cases, leet)
+        candidates = deduplicate(_shard_candidates(candidates, shard, shards), dedup, **dedup_options)
+    else:
+        candidates = generate_candidates(itertools.islice(source, shard, None, shards), prefixes, suffixes,
+                                         cases, leet)
+    return write_candidates(candidates, shard_path(output_path, shard, shards), format=format)
+
+def generate_wordlist(output_path, word_files=None, prefixes=PREFIXES, suffixes=SUFFIXES,
+                      cases=('asis',), leet=False, workers=1, dedup=None, bloom_capacity=BLOOM_CAPACITY,
+                      bloom_error=BLOOM_ERROR, tmpdir=None, format='text'):
+    '''
+    Generates a wordlist file, or one file per shard when several workers are used.
+
+    Args:
+        output_path (str): The path to the output file.
+        word_files (list): Dictionary files to read base words from. Defaults to the built-in words.
+        prefixes (list): Strings prepended to each candidate.
+        suffixes (list): Strings appended to each candidate.
+        cases (iterable): Keys of CASES to apply.
+        leet (bool): Also emit leet-substituted forms.
+        workers (int): The number of processes. Above 1, the words are sharded across
+            processes and each writes its own file named by shard_path.
+        dedup (str): None, 'sort' or 'bloom'. See deduplicate.
+        bloom_capacity (int): The expected number of distinct candidates, split across shards.
+        bloom_error (float): The acceptable Bloom filter false-positive rate.
+        tmpdir (str): Where to put sort-merge run files.
+        format (str): One of FORMATS.
+
+    Returns:
+        int: The number of candidates written.
+    '''
+    if workers <= 1:
+        source = load_words(word_files) if word_files else words
+        candidates = generate_candidates(source, prefixes, suffixes, cases, leet)
+        candidates = deduplicate(candidates, dedup, bloom_capacity, bloom_error, tmpdir)
+        return write_candidates(candidates, output_path, format=format)
+
+    dedup_options = {'bloom_capacity': max(1, bloom_capacity // workers), 'bloom_error': bloom_error,
+                     'tmpdir': tmpdir}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_write_shard, word_files, shard, workers, output_path,
+                            list(prefixes), list(suffixes), tuple(cases), leet, dedup, dedup_options, format)
+            for shard in range(workers)
+        ]
+        return sum(future.result() for future in futures)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a password candidate wordlist.')
+    parser.add_argument('--words', nargs='+', metavar='FILE', help='Dictionary files with one base word per line')
+    parser.add_argument('--prefix', nargs='*', default=PREFIXES, help='Prefixes to prepend')
+    parser.add_argument('--suffix', nargs='*', help='Suffixes to append')
+    parser.add_argument('--suffix-range', nargs=2, type=int, metavar=('START', 'END'),
+                        help='Append every number from START to END inclusive')
+    parser.add_argument('--width', type=int, default=2, help='Zero-padded width of --suffix-range numbers')
+    parser.add_argument('--case', nargs='+', choices=sorted(CASES), default=['asis'], help='Case rules to apply')
+    parser.add_argument('--leet', action='store_true', help='Also emit leet-substituted forms')
+    parser.add_argument('--workers', type=int, default=1, help='Processes to shard the output across')
+    parser.add_argument('--output', default='formatted_words.lst', help='Output file')
+    parser.add_argument('--dedup', choices=['sort', 'bloom'], help='Drop duplicate candidates')
+    parser.add_argument('--bloom-capacity', type=int, default=BLOOM_CAPACITY,
+                        help='Expected number of distinct candidates for --dedup bloom')
+    parser.add_argument('--bloom-error', type=float, default=BLOOM_ERROR,
+                        help='Acceptable false-positive rate for --dedup bloom')
+    parser.add_argument('--tmpdir', help='Folder for the --dedup sort run files')
+    parser.add_argument('--format', choices=FORMATS, default='text', help='Output format')
+    args = parser.parse_args(argv)
+
+    suffixes = list(args.suffix or [])
+    if args.suffix_range:
+        start, end = args.suffix_range
+        suffixes += [f"{num:0{args.width}d}" for num in range(start, end + 1)]
+    if args.suffix is None and not args.suffix_range:
+        suffixes = SUFFIXES
 
-for word in words:
-    for num in range(10):
-        formatted_words.append(f"!{word}{num:02d}")
-        formatted_words.append(f"@{word}{num:02d}")
+    count = generate_wordlist(args.output, args.words, args.prefix, suffixes, args.case, args.leet, args.workers,
+                              args.dedup, args.bloom_capacity, args.bloom_error, args.tmpdir, args.format)
+    print(f"Wrote {count} candidates")
 
-with open("formatted_words.lst", "w") as file:
-    file.write("\n".join(formatted_words))
+if __name__ == '__main__':
+    main()
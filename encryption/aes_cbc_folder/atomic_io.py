@@ -0,0 +1,194 @@
+# VuduVations AES CBC Folder Atomic I/O
+# Author: S Halverson @vuduvations
+# License: BSD 3-Clause
+
+import os
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+FICLONE = 0x40049409  # Linux ioctl that shares a file's extents (reflink) on btrfs, XFS and others
+FSYNC_BATCH = 64  # Temp files committed per batch in bulk runs
+COPY_RANGE_CHUNK = 64 * 1024 * 1024
+
+def fsync_path(path):
+    """
+    Flushes a file's contents to stable storage.
+
+    Args:
+        path (str): The path to the file.
+
+    Returns:
+        None
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def fsync_dir(path):
+    """
+    Flushes a directory entry update, such as a rename, to stable storage. A no-op where
+    directories cannot be opened, as on Windows.
+
+    Args:
+        path (str): The path to the directory.
+
+    Returns:
+        None
+    """
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path or '.', os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def temp_path_for(file_path):
+    """
+    Creates an empty temp file next to the given file, on the same filesystem so it can be renamed over it.
+
+    Args:
+        file_path (str): The file the temp file will replace.
+
+    Returns:
+        str: The path to the temp file.
+    """
+    directory, name = os.path.split(file_path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory or '.')
+    os.close(fd)
+    return tmp_path
+
+def fast_copy(src, dst):
+    """
+    Copies a file using the cheapest mechanism available: a reflink, then an in-kernel
+    os.copy_file_range, then a regular buffered copy. Metadata is copied as with shutil.copy2.
+
+    Args:
+        src (str): The path to the file to copy.
+        dst (str): The path to the copy.
+
+    Returns:
+        str: The mechanism used: 'reflink', 'copy_file_range' or 'copy'.
+    """
+    method = 'copy'
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                method = 'reflink'
+            except OSError:
+                pass
+
+        if method == 'copy' and hasattr(os, 'copy_file_range'):
+            try:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), COPY_RANGE_CHUNK):
+                    pass
+                method = 'copy_file_range'
+            except OSError:
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+
+        if method == 'copy':
+            shutil.copyfileobj(fsrc, fdst)
+
+    shutil.copystat(src, dst)
+    return method
+
+def link_or_copy(src, dst):
+    """
+    Hard links a file to a new path, falling back to fast_copy across filesystems or where
+    links are unsupported. Only safe when the source will be replaced rather than modified in place.
+
+    Args:
+        src (str): The path to the file.
+        dst (str): The path to the link or copy. An existing file there is replaced.
+
+    Returns:
+        str: The mechanism used: 'link', 'reflink', 'copy_file_range' or 'copy'.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return 'link'
+    except OSError:
+        return fast_copy(src, dst)
+
+class ReplaceBatch:
+    """
+    Atomically moves finished temp files over their targets, deferring the fsyncs so bulk
+    runs pay for them in batches.
+
+    Until a batch is committed the originals are untouched, so a crash leaves either the old
+    file or the complete new one, never a partial write. Each commit fsyncs the batch's temp
+    files, renames them over their targets and fsyncs each affected directory once.
+
+    Args:
+        size (int): The number of files per batch. 1 commits every file immediately.
+        fsync (bool): Flush to stable storage before and after the renames.
+        on_commit (callable): Called with each target path once its replacement is durable.
+    """
+
+    def __init__(self, size=FSYNC_BATCH, fsync=True, on_commit=None):
+        self.size = size
+        self.fsync = fsync
+        self.on_commit = on_commit
+        self._pending = []
+
+    def add(self, tmp_path, final_path):
+        """
+        Queues a temp file to replace its target, committing the batch once it is full.
+
+        Args:
+            tmp_path (str): The finished temp file.
+            final_path (str): The file it replaces.
+
+        Returns:
+            None
+        """
+        self._pending.append((tmp_path, final_path))
+        if len(self._pending) >= self.size:
+            self.commit()
+
+    def commit(self):
+        """
+        Commits every queued replacement.
+
+        Returns:
+            None
+        """
+        pending, self._pending = self._pending, []
+        if self.fsync:
+            for tmp_path, _ in pending:
+                fsync_path(tmp_path)
+
+        for tmp_path, final_path in pending:
+            os.replace(tmp_path, final_path)
+
+        if self.fsync:
+            for directory in {os.path.dirname(final_path) for _, final_path in pending}:
+                fsync_dir(directory)
+
+        if self.on_commit is not None:
+            for _, final_path in pending:
+                self.on_commit(final_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            for tmp_path, _ in self._pending:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._pending = []
@@ -0,0 +1,250 @@
+# VuduVations AES CBC Cipher Backends
+# Author: S Halverson @vuduvations
+# License: BSD 3-Clause
+
+'''
+A common interface over the AES-CBC implementations in the repo: the
+`cryptography` library used by the folder tools and `pycryptodome` used by
+archives/AES_CBC_pycryptodome.py.
+
+get_backend() picks the backend for this process. An explicit name or the
+VV_CIPHER_BACKEND environment variable wins; otherwise a short micro-benchmark
+of every installed backend picks the fastest, and the result is cached on disk
+so later startups on the same host skip the probe.
+'''
+
+import json
+import os
+import platform
+import threading
+import time
+
+PROBE_BYTES = 4 * 1024 * 1024
+PROBE_ROUNDS = 3
+BACKEND_ENV = 'VV_CIPHER_BACKEND'
+CACHE_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+    'vuduvations', 'cipher_backend.json'
+)
+
+class CryptographyBackend:
+    """AES-CBC through the `cryptography` library (OpenSSL)."""
+
+    name = 'cryptography'
+
+    def __init__(self):
+        import cryptography
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+        from cryptography.hazmat.backends import default_backend
+
+        self.version = cryptography.__version__
+        self._cipher = lambda key, iv: Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
+
+    def cbc_encryptor(self, key, iv):
+        """
+        Creates a streaming AES-CBC encryptor.
+
+        Args:
+            key (bytes): The AES key.
+            iv (bytes): The 16-byte IV.
+
+        Returns:
+            object: An encryptor with update(data), update_into(data, buf) and finalize().
+        """
+        return self._cipher(key, iv).encryptor()
+
+    def cbc_decryptor(self, key, iv):
+        """
+        Creates a streaming AES-CBC decryptor.
+
+        Args:
+            key (bytes): The AES key.
+            iv (bytes): The 16-byte IV.
+
+        Returns:
+            object: A decryptor with update(data), update_into(data, buf) and finalize().
+        """
+        return self._cipher(key, iv).decryptor()
+
+class _BlockBufferedCipher:
+    """
+    Adapts a pycryptodome CBC cipher, which only accepts whole blocks, to the streaming
+    update/update_into/finalize interface of a `cryptography` context.
+    """
+
+    def __init__(self, operation):
+        self._operation = operation
+        self._tail = b''
+
+    def update_into(self, data, buf):
+        if self._tail:
+            data = self._tail + bytes(data)
+        usable = len(data) - len(data) % 16
+        self._tail = bytes(data[usable:])
+        if usable:
+            self._operation(data[:usable], output=memoryview(buf)[:usable])
+        return usable
+
+    def update(self, data):
+        buf = bytearray(len(data) + 16)
+        return bytes(buf[:self.update_into(data, buf)])
+
+    def finalize(self):
+        if self._tail:
+            raise ValueError("The length of the provided data is not a multiple of the block length.")
+        return b''
+
+class PycryptodomeBackend:
+    """AES-CBC through `pycryptodome`."""
+
+    name = 'pycryptodome'
+
+    def __init__(self):
+        import Crypto
+        from Crypto.Cipher import AES
+
+        self.version = Crypto.__version__
+        self._aes = AES
+
+    def cbc_encryptor(self, key, iv):
+        """Creates a streaming AES-CBC encryptor. See CryptographyBackend.cbc_encryptor."""
+        return _BlockBufferedCipher(self._aes.new(key, self._aes.MODE_CBC, iv).encrypt)
+
+    def cbc_decryptor(self, key, iv):
+        """Creates a streaming AES-CBC decryptor. See CryptographyBackend.cbc_decryptor."""
+        return _BlockBufferedCipher(self._aes.new(key, self._aes.MODE_CBC, iv).decrypt)
+
+BACKENDS = {backend.name: backend for backend in (CryptographyBackend, PycryptodomeBackend)}
+
+_selected = None
+_lock = threading.Lock()
+
+def available_backends():
+    """
+    Instantiates every backend whose library is installed.
+
+    Returns:
+        dict: Backend instances by name.
+    """
+    backends = {}
+    for name, backend_class in BACKENDS.items():
+        try:
+            backends[name] = backend_class()
+        except ImportError:
+            pass
+    return backends
+
+def probe(backends, size=PROBE_BYTES, rounds=PROBE_ROUNDS):
+    """
+    Measures the AES-CBC encryption throughput of each backend.
+
+    Args:
+        backends (dict): Backend instances by name.
+        size (int): The number of bytes encrypted per round.
+        rounds (int): The number of rounds; the fastest is kept.
+
+    Returns:
+        dict: MB/s by backend name.
+    """
+    key = os.urandom(32)
+    iv = os.urandom(16)
+    data = memoryview(os.urandom(size))
+    out = bytearray(size + 16)
+    results = {}
+    for name, backend in backends.items():
+        best = float('inf')
+        for _ in range(rounds):
+            started = time.perf_counter()
+            backend.cbc_encryptor(key, iv).update_into(data, out)
+            best = min(best, time.perf_counter() - started)
+        results[name] = size / 1e6 / max(best, 1e-9)
+    return results
+
+def _fingerprint(backends):
+    return {
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'python': platform.python_version(),
+        'versions': {name: backend.version for name, backend in backends.items()},
+    }
+
+def _load_cache(cache_path, fingerprint):
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('fingerprint') != fingerprint:
+        return None
+    return cached.get('backend')
+
+def _save_cache(cache_path, fingerprint, backend, results):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w') as f:
+            json.dump({'fingerprint': fingerprint, 'backend': backend, 'results': results}, f, indent=2)
+    except OSError:
+        pass  # The cache is an optimisation; an unwritable home directory must not break encryption
+
+def select_backend(name=None, cache_path=CACHE_PATH):
+    """
+    Picks a backend: the given name, then VV_CIPHER_BACKEND, then the cached or freshly probed fastest.
+
+    Args:
+        name (str): A backend name to force.
+        cache_path (str): Where the probe result is cached. None disables the cache.
+
+    Returns:
+        object: The backend instance.
+
+    Raises:
+        ValueError: If a forced backend is unknown or not installed.
+    """
+    backends = available_backends()
+    name = name or os.environ.get(BACKEND_ENV)
+    if name:
+        if name not in backends:
+            raise ValueError(f"Cipher backend '{name}' is unknown or not installed; available: {sorted(backends)}")
+        return backends[name]
+
+    if len(backends) == 1:
+        return next(iter(backends.values()))
+
+    fingerprint = _fingerprint(backends)
+    cached = _load_cache(cache_path, fingerprint) if cache_path else None
+    if cached in backends:
+        return backends[cached]
+
+    results = probe(backends)
+    fastest = max(results, key=results.get)
+    if cache_path:
+        _save_cache(cache_path, fingerprint, fastest, results)
+    return backends[fastest]
+
+def get_backend():
+    """
+    Returns the backend for this process, selecting it on first use.
+
+    Returns:
+        object: The backend instance.
+    """
+    global _selected
+    if _selected is None:
+        with _lock:
+            if _selected is None:
+                _selected = select_backend()
+    return _selected
+
+def set_backend(name):
+    """
+    Forces the backend for this process.
+
+    Args:
+        name (str): A backend name, or None to select again on next use.
+
+    Returns:
+        None
+    """
+    global _selected
+    with _lock:
+        _selected = select_backend(name) if name else None
@@ -0,0 +1,328 @@
+# VuduVations AES CBC Folder Container Format
+# Author: S Halverson @vuduvations
+# License: BSD 3-Clause
+
+'''
+Every encrypted file starts with a self-describing header:
+
+    magic       4 bytes   b'VVAE'
+    version     1 byte    2
+    kdf         1 byte    1 = PBKDF2-HMAC-SHA256
+    iterations  4 bytes   big-endian PBKDF2 iteration count
+    salt       16 bytes   PBKDF2 salt, identifies the master key
+    file salt  16 bytes   HKDF salt for this file's keys
+    iv         16 bytes   CBC initialization vector
+    key check  16 bytes   HMAC of the fields above under the file's MAC key
+
+followed by the AES-CBC/PKCS7 ciphertext and a 32-byte HMAC-SHA256 of the header
+and ciphertext. The expensive PBKDF2 step runs once per session to produce a
+master key, and each file gets its own encryption and MAC keys from a cheap HKDF
+step over the master key and the file salt. The key check rejects a wrong
+password as soon as the header is read, and the MAC lets a file be verified
+without decrypting it.
+
+Version 1 files have the same header without the key check, no MAC, and a
+single HKDF-derived key. They are still read.
+
+Files written before the header existed start directly with the IV and use a
+key derived from the folder's 'salt.bin'. They are told apart by the magic.
+'''
+
+import hashlib
+import hmac
+import os
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.backends import default_backend
+# instrumentation.py is shared with the CBA tool at the repository root. Every folder tool
+# imports this module first, so the path is added here once for all of them
+_REPO_ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+if _REPO_ROOT not in sys.path:
+    sys.path.append(_REPO_ROOT)
+from instrumentation import timed
+
+MAGIC = b'VVAE'
+VERSION = 2
+KDF_PBKDF2_SHA256 = 1
+ITERATIONS = 100000
+HEADER_V1 = struct.Struct('>4sBBI16s16s16s')
+HEADER = struct.Struct('>4sBBI16s16s16s16s')
+KEY_CHECK_SIZE = 16
+MAC_SIZE = 32
+KEY_CACHE_SIZE = 32  # Master keys kept per KeyRing
+FILE_KEY_INFO = b'vuduvations aes-cbc file key v1'
+FILE_KEYS_INFO = b'vuduvations aes-cbc file keys v2'
+
+class IntegrityError(ValueError):
+    """Raised when a file fails its key check or MAC, or is truncated."""
+
+@timed('derive_key')
+def derive_master_key(password, salt, iterations=ITERATIONS):
+    """
+    Derives a master key from the given password and salt using PBKDF2 with HMAC-SHA256.
+
+    Args:
+        password (bytes): The password to derive the key from.
+        salt (bytes): The salt to use for key derivation.
+        iterations (int): The PBKDF2 iteration count.
+
+    Returns:
+        bytes: The derived master key.
+    """
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=iterations,
+        backend=default_backend()
+    )
+    return kdf.derive(password)
+
+def derive_file_key(master_key, file_salt, info=FILE_KEY_INFO):
+    """
+    Derives a per-file key from a master key using HKDF with SHA256.
+
+    Args:
+        master_key (bytes): The session master key.
+        file_salt (bytes): The file's random HKDF salt.
+        info (bytes): The HKDF context, which keeps keys for different file formats apart.
+
+    Returns:
+        bytes: The derived file key.
+    """
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=file_salt,
+        info=info,
+        backend=default_backend()
+    ).derive(master_key)
+
+def derive_file_keys(master_key, file_salt):
+    """
+    Derives a version 2 file's encryption and MAC keys from a master key using HKDF with SHA256.
+
+    Args:
+        master_key (bytes): The session master key.
+        file_salt (bytes): The file's random HKDF salt.
+
+    Returns:
+        tuple: (encryption key, MAC key), 32 bytes each.
+    """
+    keys = HKDF(
+        algorithm=hashes.SHA256(),
+        length=64,
+        salt=file_salt,
+        info=FILE_KEYS_INFO,
+        backend=default_backend()
+    ).derive(master_key)
+    return keys[:32], keys[32:]
+
+def key_check(mac_key, fields):
+    """
+    Computes the key check value stored in a version 2 header.
+
+    Args:
+        mac_key (bytes): The file's MAC key.
+        fields (bytes): The header up to the key check.
+
+    Returns:
+        bytes: The 16-byte key check value.
+    """
+    return hmac.new(mac_key, b'key check' + fields, hashlib.sha256).digest()[:KEY_CHECK_SIZE]
+
+def read_header(f):
+    """
+    Reads a container header from the start of an open file.
+
+    Args:
+        f (file): A binary file positioned at its start.
+
+    Returns:
+        tuple: (version, iterations, salt, file_salt, iv, key_check, raw header), or None for a
+            file without a header. key_check is None for version 1. A file without a header is
+            rewound to its start.
+
+    Raises:
+        ValueError: If the header has an unsupported version or KDF.
+    """
+    data = f.read(HEADER_V1.size)
+    if len(data) < HEADER_V1.size or not data.startswith(MAGIC):
+        f.seek(0)
+        return None
+
+    magic, version, kdf, iterations, salt, file_salt, iv = HEADER_V1.unpack(data)
+    if version not in (1, VERSION):
+        raise ValueError(f"Unsupported container version: {version}")
+    if kdf != KDF_PBKDF2_SHA256:
+        raise ValueError(f"Unsupported key derivation function: {kdf}")
+
+    check = None
+    if version == VERSION:
+        check = f.read(KEY_CHECK_SIZE)
+        if len(check) < KEY_CHECK_SIZE:
+            raise IntegrityError("File is truncated inside its header")
+        data += check
+    return version, iterations, salt, file_salt, iv, check, data
+
+def iter_ciphertext(f, mac, buffer):
+    """
+    Reads the ciphertext following the header, checking the MAC of a version 2 file at the end.
+
+    Args:
+        f (file): A binary file positioned just after its header.
+        mac (hmac.HMAC): The MAC returned by KeyRing.open, or None for files without one.
+        buffer (bytearray): The read buffer. Each yielded view is overwritten by the next read.
+
+    Yields:
+        memoryview: Consecutive pieces of the ciphertext.
+
+    Raises:
+        IntegrityError: If the file is truncated or fails its MAC check.
+    """
+    view = memoryview(buffer)
+    remaining = os.fstat(f.fileno()).st_size - f.tell() - (MAC_SIZE if mac is not None else 0)
+    if remaining < 0:
+        raise IntegrityError("File is too short to hold its MAC")
+    while remaining:
+        count = f.readinto(view[:min(len(view), remaining)])
+        if not count:
+            raise IntegrityError("File is truncated")
+        remaining -= count
+        if mac is not None:
+            mac.update(view[:count])
+        yield view[:count]
+
+    if mac is not None and not hmac.compare_digest(mac.digest(), f.read(MAC_SIZE)):
+        raise IntegrityError("File failed its MAC check; it is corrupt or was modified")
+
+class MasterKey:
+    """
+    A master key derived once per session, from which every file's key and header are produced.
+
+    Only the derived key is kept, so instances can be shipped to worker processes without the password.
+
+    Args:
+        password (bytes): The password to derive the master key from.
+        salt (bytes): The PBKDF2 salt. A random one is generated if omitted.
+        iterations (int): The PBKDF2 iteration count.
+    """
+
+    def __init__(self, password, salt=None, iterations=ITERATIONS):
+        self.salt = salt or os.urandom(16)
+        self.iterations = iterations
+        self.key = derive_master_key(password, self.salt, iterations)
+
+    def new_file(self):
+        """
+        Generates the header, key and MAC for a new encrypted file.
+
+        The caller passes every ciphertext byte to mac.update and writes mac.digest()
+        after the ciphertext.
+
+        Returns:
+            tuple: (header, file_key, iv, mac) where header is the serialized container header
+            and mac an HMAC-SHA256 already fed the header.
+        """
+        file_salt = os.urandom(16)
+        iv = os.urandom(16)  # CBC requires a 16-byte IV
+        file_key, mac_key = derive_file_keys(self.key, file_salt)
+        fields = HEADER_V1.pack(MAGIC, VERSION, KDF_PBKDF2_SHA256, self.iterations, self.salt, file_salt, iv)
+        header = fields + key_check(mac_key, fields)
+        return header, file_key, iv, hmac.new(mac_key, header, hashlib.sha256)
+
+class KeyRing:
+    """
+    Resolves the key for any encrypted file under one password, caching master keys in an LRU.
+
+    Master keys are keyed by (salt, iterations), so a folder whose files were encrypted in
+    different sessions costs one PBKDF2 run per distinct salt rather than one per file.
+
+    Args:
+        password (bytes): The password the files were encrypted with.
+        legacy_salt (bytes): The 'salt.bin' contents used for files without a header, if any.
+        maxsize (int): The number of master keys to keep cached.
+    """
+
+    def __init__(self, password, legacy_salt=None, maxsize=KEY_CACHE_SIZE):
+        self.password = password
+        self.legacy_salt = legacy_salt
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()  # Guards _cache and _deriving only, never a derivation
+        self._deriving = {}  # (salt, iterations): lock held while that master key is derived
+
+    def master_key(self, salt, iterations=ITERATIONS):
+        """
+        Returns the master key for a salt, deriving and caching it on first use.
+
+        Args:
+            salt (bytes): The PBKDF2 salt.
+            iterations (int): The PBKDF2 iteration count.
+
+        Returns:
+            bytes: The master key.
+        """
+        cache_key = (salt, iterations)
+        with self._lock:
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                return self._cache[cache_key]
+            deriving = self._deriving.setdefault(cache_key, threading.Lock())
+
+        # Workers after the same salt wait for one PBKDF2 run; other salts derive concurrently
+        with deriving:
+            with self._lock:
+                if cache_key in self._cache:
+                    self._cache.move_to_end(cache_key)
+                    return self._cache[cache_key]
+            try:
+                key = derive_master_key(self.password, salt, iterations)
+                with self._lock:
+                    self._cache[cache_key] = key
+                    if len(self._cache) > self.maxsize:
+                        self._cache.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._deriving.pop(cache_key, None)
+            return key
+
+    def open(self, f):
+        """
+        Reads the header of an open encrypted file and resolves its key.
+
+        A version 2 file's key check is verified here, so a wrong password fails before
+        any ciphertext is read.
+
+        Args:
+            f (file): A binary file positioned at its start. It is left positioned at the ciphertext.
+
+        Returns:
+            tuple: (key, iv, mac) for decrypting the rest of the file. mac is an HMAC-SHA256 fed
+            the header, to be checked with iter_ciphertext, or None for files without a MAC.
+
+        Raises:
+            ValueError: If the file has no header and no legacy salt is available.
+            IntegrityError: If the key check fails: a wrong password or a corrupt header.
+        """
+        header = read_header(f)
+        if header is None:
+            if self.legacy_salt is None:
+                raise ValueError("File has no container header and no 'salt.bin' was found")
+            iv = f.read(16)
+            return self.master_key(self.legacy_salt), iv, None
+
+        version, iterations, salt, file_salt, iv, check, raw = header
+        master_key = self.master_key(salt, iterations)
+        if version == 1:
+            return derive_file_key(master_key, file_salt), iv, None
+
+        file_key, mac_key = derive_file_keys(master_key, file_salt)
+        if not hmac.compare_digest(key_check(mac_key, raw[:HEADER_V1.size]), check):
+            raise IntegrityError("Key check failed: wrong password or corrupt header")
+        return file_key, iv, hmac.new(mac_key, raw, hashlib.sha256)
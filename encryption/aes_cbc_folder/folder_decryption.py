@@ -3,99 +3,242 @@
 # License: BSD 3-Clause
 
 import os
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.backends import default_backend
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives.ciphers import algorithms
 from cryptography.hazmat.primitives import padding
-
-def derive_key(password, salt):
+from work_pool import MAX_INFLIGHT_BYTES, bounded_submit
+from backends import get_backend
+from container import KeyRing, iter_ciphertext
+from manifest import MANIFEST_NAME, Manifest
+from instrumentation import returned_size, timed  # Importable once container has run
+
+CHUNK_SIZE = 64 * 1024  # Default streaming buffer size in bytes
+BLOCK_BYTES = algorithms.AES.block_size // 8
+PROGRESS_INTERVAL = 5.0  # Seconds between aggregate progress reports
+
+@timed('decrypt_file', size=returned_size)
+def decrypt_file(file_path, key, output_folder, input_folder=None, chunk_size=CHUNK_SIZE):
     """
-    Derives a cryptographic key from the given password and salt using PBKDF2 with HMAC-SHA256.
+    Decrypts a file using AES decryption in CBC mode and PKCS7 padding.
+
+    The ciphertext is streamed through the decryptor and unpadder in fixed-size
+    chunks, so peak memory stays flat no matter how large the file is. A file with
+    a MAC is checked as it streams. If decryption or the check fails, the
+    partially written output file is removed.
 
     Args:
-        password (bytes): The password to derive the key from.
-        salt (bytes): The salt to use for key derivation.
+        file_path (str): The path to the file to be decrypted.
+        key (KeyRing): The key ring resolving the file's key from its header.
+        output_folder (str): The path to the folder where the decrypted file will be saved.
+        input_folder (str): The folder the file's relative output path is taken from.
+            Defaults to the file's own directory.
+        chunk_size (int): The number of ciphertext bytes read per iteration.
 
     Returns:
-        bytes: The derived key.
+        int: The number of bytes read.
     """
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000,
-        backend=default_backend()
-    )
-    key = kdf.derive(password)
-    return key
-
-def decrypt_file(file_path, key, output_folder):
+    if input_folder is None:
+        input_folder = os.path.dirname(file_path)
+
+    relative_path = os.path.relpath(file_path, start=input_folder)
+    output_path = os.path.join(output_folder, relative_path)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    # update_into needs one block of headroom beyond its input
+    read_buffer = bytearray(chunk_size)
+    out_buffer = bytearray(chunk_size + BLOCK_BYTES)
+    out_view = memoryview(out_buffer)
+
+    try:
+        with open(file_path, 'rb') as src, open(output_path, 'wb') as dst:
+            file_key, iv, mac = key.open(src)
+            decryptor = get_backend().cbc_decryptor(file_key, iv)
+            unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+
+            for chunk in iter_ciphertext(src, mac, read_buffer):
+                written = decryptor.update_into(chunk, out_buffer)
+                dst.write(unpadder.update(out_view[:written]))
+
+            dst.write(unpadder.update(decryptor.finalize()) + unpadder.finalize())
+            total = src.tell()
+    except Exception:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+    return total
+
+@timed('verify_file', size=returned_size)
+def verify_file(file_path, key, chunk_size=CHUNK_SIZE):
     """
-    Decrypts a file using AES decryption in CBC mode and PKCS7 padding.
+    Checks that an encrypted file is intact and opens with the key, without writing any plaintext.
+
+    A file with a MAC is checked against it without decrypting, and a wrong password is rejected
+    by the key check in its header before any ciphertext is read. Older files have no MAC, so they
+    are decrypted in memory and the result discarded; only their padding is checked, which catches
+    most but not all wrong passwords and corruption.
 
     Args:
-        file_path (str): The path to the file to be decrypted.
-        key (bytes): The decryption key.
-        output_folder (str): The path to the folder where the decrypted file will be saved.
+        file_path (str): The path to the file to be verified.
+        key (KeyRing): The key ring resolving the file's key from its header.
+        chunk_size (int): The number of ciphertext bytes read per iteration.
 
     Returns:
-        None
+        int: The number of bytes read.
+
+    Raises:
+        IntegrityError: If the file fails its key check or MAC, or is truncated.
+        ValueError: If an older file fails its padding check.
+    """
+    read_buffer = bytearray(chunk_size)
+
+    with open(file_path, 'rb') as src:
+        file_key, iv, mac = key.open(src)
+        if mac is not None:
+            for _ in iter_ciphertext(src, mac, read_buffer):
+                pass
+            return src.tell()
+
+        out_buffer = bytearray(chunk_size + BLOCK_BYTES)
+        out_view = memoryview(out_buffer)
+        decryptor = get_backend().cbc_decryptor(file_key, iv)
+        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        for chunk in iter_ciphertext(src, None, read_buffer):
+            written = decryptor.update_into(chunk, out_buffer)
+            unpadder.update(out_view[:written])
+        unpadder.update(decryptor.finalize())
+        unpadder.finalize()
+        return src.tell()
+
+def report_progress(files_done, bytes_done, errors, started, action='Decrypted'):
     """
-    with open(file_path, 'rb') as f:
-        iv = f.read(16)
-        ciphertext = f.read()
+    Prints a single aggregate progress line for a folder decryption run.
 
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-    decryptor = cipher.decryptor()
+    Args:
+        files_done (int): The number of files processed so far.
+        bytes_done (int): The number of ciphertext bytes processed so far.
+        errors (int): The number of files that failed.
+        started (float): The time.monotonic() value at the start of the run.
+        action (str): The verb the line starts with.
 
-    padded_data = decryptor.update(ciphertext) + decryptor.finalize()
+    Returns:
+        None
+    """
+    elapsed = max(time.monotonic() - started, 1e-9)
+    print(f"{action} {files_done} files, {bytes_done / 1e6:.1f} MB "
+          f"({bytes_done / 1e6 / elapsed:.1f} MB/s), {errors} errors")
 
-    unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
-    file_data = unpadder.update(padded_data) + unpadder.finalize()
+def decrypt_folder(input_folder, output_folder, password, workers=None, max_pending=None,
+                   max_inflight_bytes=MAX_INFLIGHT_BYTES, chunk_size=CHUNK_SIZE,
+                   progress_interval=PROGRESS_INTERVAL, changed_since=None, verify_only=False):
+    """
+    Decrypts all files in the specified input folder using the given password, and saves them to the output folder.
 
-    relative_path = os.path.relpath(file_path, start=input_folder)
-    output_path = os.path.join(output_folder, relative_path)
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    Each file's key is resolved from its own header, with master keys cached per salt, so
+    folders mixing files from several encryption sessions decrypt with a single password.
+    A 'salt.bin' in the input folder is only needed for files written before the header
+    existed. Files are decrypted concurrently on a thread pool, so reading the next files overlaps with
+    decrypting and writing the current ones. The tree walk is consumed lazily and the number and
+    total size of queued files are capped. A failing file does not abort the run; its error is
+    collected and returned instead. Progress is printed as one aggregate line every
+    progress_interval seconds rather than once per file.
 
-    with open(output_path, 'wb') as f:
-        f.write(file_data)
+    With changed_since, only files encrypted at or after that time are decrypted. The
+    incremental manifest decides when the folder has one; otherwise the ciphertext mtime does.
 
-def decrypt_folder(input_folder, output_folder, password):
-    """
-    Decrypts all files in the specified input folder using the given password, and saves them to the output folder.
+    With verify_only, each file is checked with verify_file instead and no plaintext is written,
+    so a backup can be checked for corruption or a wrong password before a full restore.
 
     Args:
         input_folder (str): The path to the folder containing encrypted files.
         output_folder (str): The path to the folder where decrypted files will be saved.
+            Unused, and may be None, with verify_only.
         password (bytes): The password to derive the decryption key.
+        workers (int): The number of pool threads. Defaults to the number of CPUs plus four.
+        max_pending (int): The maximum number of queued files. Defaults to four per worker.
+        max_inflight_bytes (int): The cap on the total size of files queued at once.
+        chunk_size (int): The number of ciphertext bytes read per iteration.
+        progress_interval (float): Seconds between progress reports, or None to disable them.
+        changed_since (float): A Unix timestamp; older files are skipped. None decrypts everything.
+        verify_only (bool): Whether to only verify the files rather than decrypt them.
 
     Returns:
-        None
+        list: (file_path, exception) tuples for the files that could not be decrypted or verified.
     """
-    with open(os.path.join(input_folder, 'salt.bin'), 'rb') as f:
-        salt = f.read()
+    legacy_salt = None
+    salt_path = os.path.join(input_folder, 'salt.bin')
+    if os.path.exists(salt_path):
+        with open(salt_path, 'rb') as f:
+            legacy_salt = f.read()
 
-    key = derive_key(password, salt)
+    key = KeyRing(password, legacy_salt)
 
-    if not os.path.exists(output_folder):
+    if not verify_only and not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    for root, _, files in os.walk(input_folder):
-        for file in files:
-            if file == 'salt.bin':
-                continue
-
-            file_path = os.path.join(root, file)
-            decrypt_file(file_path, key, output_folder)
-            print(f"Decrypted: {file_path}")
-
-# Example usage
-input_folder = '/path/to/encrypted/folder'  # Replace with the path to your encrypted folder
-output_folder = '/path/to/decrypted/folder'  # Replace with the path to your decrypted folder
-password = b'Vuduchild'  # Replace with your password
-
-decrypt_folder(input_folder, output_folder, password)
+    # Threads rather than processes: the work is I/O bound as much as it is AES bound
+    workers = workers or (os.cpu_count() or 1) + 4
+    max_pending = max_pending or workers * 4
+
+    changed = None
+    manifest_path = os.path.join(input_folder, MANIFEST_NAME)
+    if changed_since is not None and os.path.exists(manifest_path):
+        with Manifest(manifest_path) as manifest:
+            changed = manifest.changed_since(changed_since)
+
+    def jobs():
+        for root, _, files in os.walk(input_folder):
+            for file in files:
+                if file == 'salt.bin' or file.startswith(MANIFEST_NAME):
+                    continue
+
+                file_path = os.path.join(root, file)
+                if changed is not None:
+                    if os.path.relpath(file_path, start=input_folder) not in changed:
+                        continue
+                elif changed_since is not None and os.path.getmtime(file_path) < changed_since:
+                    continue
+
+                if verify_only:
+                    yield os.path.getsize(file_path), file_path, (file_path, key, chunk_size)
+                else:
+                    yield os.path.getsize(file_path), file_path, (file_path, key, output_folder, input_folder, chunk_size)
+
+    task = verify_file if verify_only else decrypt_file
+    action = 'Verified' if verify_only else 'Decrypted'
+    errors = []
+    files_done = 0
+    bytes_done = 0
+    started = last_report = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for file_path, future in bounded_submit(executor, task, jobs(), max_pending, max_inflight_bytes):
+            try:
+                bytes_done += future.result()
+            except Exception as e:
+                errors.append((file_path, e))
+            files_done += 1
+
+            if progress_interval is not None and time.monotonic() - last_report >= progress_interval:
+                report_progress(files_done, bytes_done, len(errors), started, action)
+                last_report = time.monotonic()
+
+    if progress_interval is not None:
+        report_progress(files_done, bytes_done, len(errors), started, action)
+        for file_path, e in errors:
+            print(f"Failed: {file_path}: {e!r}")
+
+    return errors
+
+if __name__ == '__main__':
+    # Example usage
+    input_folder = '/path/to/encrypted/folder'  # Replace with the path to your encrypted folder
+    output_folder = '/path/to/decrypted/folder'  # Replace with the path to your decrypted folder
+    password = b'Vuduchild'  # Replace with your password
+
+    decrypt_folder(input_folder, output_folder, password)
+    # decrypt_folder(input_folder, None, password, verify_only=True)  # Check the backup without writing plaintext
 
 # Best Practices Information:
 # 1. **Password Management**: Ensure the password used for encryption is securely managed and not hard-coded in production environments.
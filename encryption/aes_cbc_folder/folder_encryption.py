@@ -3,86 +3,206 @@
 # License: BSD 3-Clause
 
 import os
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import algorithms
 from cryptography.hazmat.primitives import padding
 import shutil
+import hashlib
+import hmac
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from work_pool import MAX_INFLIGHT_BYTES, bounded_submit
+from backends import get_backend
+from container import MasterKey
+from manifest import MANIFEST_NAME, Manifest
+from atomic_io import FSYNC_BATCH, ReplaceBatch, fast_copy, link_or_copy, temp_path_for
+from instrumentation import returned_size, timed  # Importable once container has run
 
-def derive_key(password, salt):
+CHUNK_SIZE = 64 * 1024  # Default streaming buffer size in bytes
+BLOCK_BYTES = algorithms.AES.block_size // 8
+
+@timed('encrypt_file', size=returned_size)
+def encrypt_file(file_path, key, chunk_size=CHUNK_SIZE):
     """
-    Derives a cryptographic key from the given password and salt using PBKDF2 with HMAC-SHA256.
+    Encrypts a file in place using AES encryption in CBC mode with PKCS7 padding.
+
+    The output starts with a container header carrying the KDF parameters, the salts,
+    the IV and a key check, followed by the ciphertext under a per-file key derived from
+    the master key and a MAC over both. The file is streamed through the padder and
+    encryptor in fixed-size chunks, so peak memory stays at a few buffers no matter how
+    large the file is. The ciphertext is longer than the plaintext (header, padding and
+    MAC), so output is held back until the bytes it would overwrite have already been
+    read.
 
     Args:
-        password (bytes): The password to derive the key from.
-        salt (bytes): The salt to use for key derivation.
+        file_path (str): The path to the file to be encrypted.
+        key (MasterKey): The session master key to derive the file key from.
+        chunk_size (int): The number of plaintext bytes read per iteration.
 
     Returns:
-        bytes: The derived key.
+        int: The number of plaintext bytes encrypted.
     """
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=salt,
-        iterations=100000,
-        backend=default_backend()
-    )
-    key = kdf.derive(password)
-    return key
+    header, file_key, iv, mac = key.new_file()
+    encryptor = get_backend().cbc_encryptor(file_key, iv)
+
+    # Pad the data to be a multiple of the block size (16 bytes for AES)
+    padder = padding.PKCS7(algorithms.AES.block_size).padder()
+
+    # The padder may release up to one buffered block on top of the chunk, and
+    # update_into needs one more block of headroom beyond its input
+    read_buffer = bytearray(chunk_size)
+    read_view = memoryview(read_buffer)
+    out_buffer = bytearray(chunk_size + 2 * BLOCK_BYTES)
+    out_view = memoryview(out_buffer)
+
+    pending = bytearray(header)
+    read_pos = 0
+    write_pos = 0
+
+    with open(file_path, 'r+b') as f:
+        while True:
+            f.seek(read_pos)
+            count = f.readinto(read_buffer)
+            if not count:
+                break
+            read_pos += count
+
+            written = encryptor.update_into(padder.update(read_view[:count]), out_buffer)
+            mac.update(out_view[:written])
+            pending += out_view[:written]
 
-def encrypt_file(file_path, key):
+            # Only overwrite plaintext that has already been read
+            writable = min(len(pending), read_pos - write_pos)
+            f.seek(write_pos)
+            f.write(pending[:writable])
+            write_pos += writable
+            del pending[:writable]
+
+        tail = encryptor.update(padder.finalize()) + encryptor.finalize()
+        mac.update(tail)
+        pending += tail + mac.digest()
+        f.seek(write_pos)
+        f.write(pending)
+
+    return read_pos
+
+@timed('encrypt_file_to', size=returned_size)
+def encrypt_file_to(file_path, output_path, key, chunk_size=CHUNK_SIZE, digest=None):
     """
-    Encrypts a file using AES encryption in CBC mode with PKCS7 padding.
+    Encrypts a file into a separate output file using AES encryption in CBC mode with PKCS7 padding.
 
     Args:
         file_path (str): The path to the file to be encrypted.
-        key (bytes): The encryption key.
+        output_path (str): The path where the container header, ciphertext and MAC will be written.
+        key (MasterKey): The session master key to derive the file key from.
+        chunk_size (int): The number of plaintext bytes read per iteration.
+        digest (hashlib hash): A hash object to update with the plaintext as it is read, if any.
 
     Returns:
-        None
+        int: The number of plaintext bytes encrypted.
     """
-    iv = os.urandom(16)  # CBC requires a 16-byte IV
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
-
-    with open(file_path, 'rb') as f:
-        file_data = f.read()
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-    # Pad the data to be a multiple of the block size (16 bytes for AES)
+    header, file_key, iv, mac = key.new_file()
+    encryptor = get_backend().cbc_encryptor(file_key, iv)
     padder = padding.PKCS7(algorithms.AES.block_size).padder()
-    padded_data = padder.update(file_data) + padder.finalize()
 
-    ciphertext = encryptor.update(padded_data) + encryptor.finalize()
+    read_buffer = bytearray(chunk_size)
+    read_view = memoryview(read_buffer)
+    out_buffer = bytearray(chunk_size + 2 * BLOCK_BYTES)
+    out_view = memoryview(out_buffer)
+    total = 0
+
+    with open(file_path, 'rb') as src, open(output_path, 'wb') as dst:
+        dst.write(header)
+        while True:
+            count = src.readinto(read_buffer)
+            if not count:
+                break
+            total += count
+            if digest is not None:
+                digest.update(read_view[:count])
+            written = encryptor.update_into(padder.update(read_view[:count]), out_buffer)
+            mac.update(out_view[:written])
+            dst.write(out_view[:written])
 
-    with open(file_path, 'wb') as f:
-        f.write(iv)
-        f.write(ciphertext)
+        tail = encryptor.update(padder.finalize()) + encryptor.finalize()
+        mac.update(tail)
+        dst.write(tail + mac.digest())
 
-def backup_file(file_path, backup_folder):
+    return total
+
+def encrypt_and_hash_file(file_path, output_path, key, content_key, chunk_size=CHUNK_SIZE):
+    """
+    Encrypts a file into a separate output file, computing the plaintext's content MAC in the same pass.
+
+    Args:
+        file_path (str): The path to the file to be encrypted.
+        output_path (str): The path where the container header, ciphertext and MAC will be written.
+        key (MasterKey): The session master key to derive the file key from.
+        content_key (bytes): The manifest's content key the plaintext is MACed with.
+        chunk_size (int): The number of plaintext bytes read per iteration.
+
+    Returns:
+        str: The HMAC-SHA256 hex digest of the plaintext.
+    """
+    digest = hmac.new(content_key, digestmod=hashlib.sha256)
+    encrypt_file_to(file_path, output_path, key, chunk_size, digest)
+    return digest.hexdigest()
+
+def backup_file(file_path, backup_folder, link=False):
     """
     Creates a backup of the specified file in the given backup folder.
 
+    The cheapest copy available is used (reflink, then copy_file_range, then a buffered copy).
+    With link=True the backup is a hard link instead, which moves no data at all but is only
+    safe when the original is about to be replaced rather than rewritten in place.
+
     Args:
         file_path (str): The path to the file to be backed up.
         backup_folder (str): The path to the backup folder.
+        link (bool): Hard link the file instead of copying it where possible.
 
     Returns:
-        None
+        str: The mechanism used: 'link', 'reflink', 'copy_file_range' or 'copy'.
     """
     if not os.path.exists(backup_folder):
         os.makedirs(backup_folder)
 
     backup_path = os.path.join(backup_folder, os.path.basename(file_path))
-    shutil.copy2(file_path, backup_path)
+    if link:
+        return link_or_copy(file_path, backup_path)
+    return fast_copy(file_path, backup_path)
+
+def report_encrypted(file_path):
+    """
+    Reports a file once its ciphertext has durably replaced it.
+
+    Args:
+        file_path (str): The encrypted file.
+
+    Returns:
+        None
+    """
+    print(f"Encrypted: {file_path}")
 
-def encrypt_single_file(file_path, password):
+def encrypt_single_file(file_path, password, master_key=None, atomic=True, batch=None):
     """
     Encrypts a single file, backing up the original file to a 'backup' folder in the same directory.
 
+    The salt travels in the encrypted file's header, so callers encrypting several files
+    pass one MasterKey as master_key instead of running PBKDF2 per file.
+
+    In atomic mode the ciphertext is written to a temp file in the same directory, which is
+    fsynced and moved over the original with os.replace, so a crash never leaves a half
+    encrypted file. The original inode survives the replace, so the backup is a hard link
+    and the file's data is read exactly once. Otherwise the file is encrypted in place.
+
     Args:
         file_path (str): The path to the file to be encrypted.
         password (bytes): The password to derive the encryption key from.
+        master_key (MasterKey): The master key to use. Without one, a new key is derived from the password.
+        atomic (bool): Replace the file atomically instead of rewriting it in place.
+        batch (ReplaceBatch): A batch to defer the fsync and replace to. Defaults to committing
+            immediately. The file is only reported as encrypted by the batch's on_commit callback.
 
     Returns:
         None
@@ -94,28 +214,155 @@ def encrypt_single_file(file_path, password):
         raise FileNotFoundError(f"No such file: '{file_path}'")
     
     backup_folder = os.path.join(os.path.dirname(file_path), 'backup')
-    salt = os.urandom(16)  # Secure random salt
-    key = derive_key(password, salt)
+    key = master_key or MasterKey(password)
 
-    # Write the salt to the backup folder
-    if not os.path.exists(backup_folder):
-        os.makedirs(backup_folder)
+    # Backup the original file
+    backup_file(file_path, backup_folder, link=atomic)
 
-    with open(os.path.join(backup_folder, 'salt.bin'), 'wb') as f:
-        f.write(salt)
+    if not atomic:
+        # Encrypt the original file in place
+        encrypt_file(file_path, key)
+        print(f"Encrypted: {file_path}")
+        return
 
-    # Backup the original file
-    backup_file(file_path, backup_folder)
+    tmp_path = temp_path_for(file_path)
+    try:
+        encrypt_file_to(file_path, tmp_path, key)
+        shutil.copymode(file_path, tmp_path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
 
-    # Encrypt the original file in place
-    encrypt_file(file_path, key)
-    print(f"Encrypted: {file_path}")
+    if batch is None:
+        with ReplaceBatch(size=1, on_commit=report_encrypted) as single:
+            single.add(tmp_path, file_path)
+    else:
+        batch.add(tmp_path, file_path)
+
+def encrypt_files(file_paths, password, master_key=None, fsync_batch=FSYNC_BATCH):
+    """
+    Atomically encrypts many files in place, backing each one up like encrypt_single_file.
+
+    The fsyncs and renames are committed fsync_batch files at a time, so a bulk run pays
+    for one flush per batch and per directory rather than several per file. Files are
+    reported as encrypted once their batch is committed, never before.
+
+    Args:
+        file_paths (iterable): The paths to the files to be encrypted.
+        password (bytes): The password to derive the encryption key from.
+        master_key (MasterKey): The master key to use. Without one, a key is derived once for this call.
+        fsync_batch (int): The number of files committed per batch.
+
+    Returns:
+        int: The number of files encrypted.
+    """
+    key = master_key or MasterKey(password)
+    encrypted = 0
+
+    with ReplaceBatch(size=fsync_batch, on_commit=report_encrypted) as batch:
+        for file_path in file_paths:
+            encrypt_single_file(file_path, password, master_key=key, batch=batch)
+            encrypted += 1
+
+    return encrypted
+
+def encrypt_folder(input_folder, output_folder, password, workers=None, use_processes=False,
+                   max_pending=None, max_inflight_bytes=MAX_INFLIGHT_BYTES, chunk_size=CHUNK_SIZE,
+                   incremental=False):
+    """
+    Encrypts all files in the specified input folder into the output folder using a worker pool.
+
+    The master key is derived once for the whole run and each file carries its own
+    header, so no separate salt file is written. The folder structure of the input is
+    mirrored in the output, and the originals are left untouched.
+
+    In incremental mode a manifest of each file's size, mtime, keyed content MAC and
+    ciphertext location is kept in the output folder. Its runs share one master key
+    salt, stored in the manifest. Later runs only encrypt new or modified files, and
+    files that disappeared from the input are tombstoned in the manifest and their
+    ciphertexts removed.
+
+    Args:
+        input_folder (str): The path to the folder containing files to be encrypted.
+        output_folder (str): The path to the folder where encrypted files will be saved.
+        password (bytes): The password to derive the encryption key from.
+        workers (int): The number of pool workers. Defaults to the number of CPUs.
+        use_processes (bool): Use a process pool instead of a thread pool.
+        max_pending (int): The maximum number of queued files. Defaults to four per worker.
+        max_inflight_bytes (int): The cap on the total size of files queued at once.
+        chunk_size (int): The number of plaintext bytes read per iteration.
+        incremental (bool): Skip files that are unchanged since the last incremental run.
+
+    Returns:
+        int: The number of files encrypted.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    manifest = None
+    if incremental:
+        manifest = Manifest(os.path.join(output_folder, MANIFEST_NAME))
+        try:
+            key = MasterKey(password, *manifest.key_params())
+            manifest.use_key(key)
+        except Exception:
+            manifest.close()
+            raise
+    else:
+        key = MasterKey(password)
+    seen_paths = set()
+
+    def jobs():
+        for root, _, files in os.walk(input_folder):
+            for file in files:
+                file_path = os.path.join(root, file)
+                relative_path = os.path.relpath(file_path, start=input_folder)
+                output_path = os.path.join(output_folder, relative_path)
+                stat = os.stat(file_path)
+
+                if manifest is not None:
+                    seen_paths.add(relative_path)
+                    if not manifest.needs_update(relative_path, file_path, stat):
+                        continue
+
+                if manifest is not None:
+                    yield stat.st_size, (relative_path, stat), (file_path, output_path, key, manifest.content_key, chunk_size)
+                else:
+                    yield stat.st_size, (relative_path, stat), (file_path, output_path, key, chunk_size)
+
+    worker = encrypt_and_hash_file if incremental else encrypt_file_to
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    encrypted = 0
+
+    try:
+        with executor_class(max_workers=workers) as executor:
+            for (relative_path, stat), future in bounded_submit(executor, worker, jobs(), max_pending, max_inflight_bytes):
+                result = future.result()
+                encrypted += 1
+                if manifest is not None:
+                    manifest.record(relative_path, stat.st_size, stat.st_mtime_ns, result, relative_path)
+
+        if manifest is not None:
+            for ciphertext in manifest.tombstone_missing(seen_paths):
+                ciphertext_path = os.path.join(output_folder, ciphertext)
+                if os.path.exists(ciphertext_path):
+                    os.remove(ciphertext_path)
+    finally:
+        if manifest is not None:
+            manifest.close()
+
+    print(f"Encrypted {encrypted} files into: {output_folder}")
+    return encrypted
 
-# Example usage
-file_path = '/path/to/your/file.txt'  # Replace with the path to your file to be encrypted
-password = b'apassword'  # Replace with your password
+if __name__ == '__main__':
+    # Example usage
+    file_path = '/path/to/your/file.txt'  # Replace with the path to your file to be encrypted
+    password = b'apassword'  # Replace with your password
 
-encrypt_single_file(file_path, password)
+    encrypt_single_file(file_path, password)
 
 # Best Practices Information:
 # 1. **Password Management**: Ensure the password used for encryption is securely managed and not hard-coded in production environments.
@@ -0,0 +1,240 @@
+# VuduVations AES CBC Folder Manifest
+# Author: S Halverson @vuduvations
+# License: BSD 3-Clause
+
+import hashlib
+import hmac
+import sqlite3
+import time
+from container import ITERATIONS, derive_file_key
+
+MANIFEST_NAME = '.vv_manifest.sqlite'
+COMMIT_EVERY = 1000  # Records written between commits
+HASH_CHUNK_SIZE = 1024 * 1024
+CONTENT_KEY_INFO = b'vuduvations manifest content key v1'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    ciphertext TEXT NOT NULL,
+    encrypted_at REAL NOT NULL,
+    deleted_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_encrypted_at ON files (encrypted_at);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+);
+'''
+
+def content_key(master_key):
+    """
+    Derives the key the manifest's content MACs are computed with.
+
+    Args:
+        master_key (MasterKey): The session master key.
+
+    Returns:
+        bytes: The 32-byte content key.
+    """
+    return derive_file_key(master_key.key, master_key.salt, CONTENT_KEY_INFO)
+
+def hash_file(file_path, key, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Computes the keyed HMAC-SHA256 hex digest of a file's contents.
+
+    Args:
+        file_path (str): The path to the file to hash.
+        key (bytes): The manifest's content key.
+        chunk_size (int): The number of bytes read per iteration.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hmac.new(key, digestmod=hashlib.sha256)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class Manifest:
+    """
+    Persistent record of which plaintext files have been encrypted, and from what content.
+
+    Stored as a SQLite database in the encrypted folder. Each row keeps the plaintext path
+    relative to the input folder, its size, mtime and content MAC when it was encrypted, the
+    relative ciphertext path, and a tombstone timestamp once the plaintext was deleted.
+
+    The content MAC is an HMAC-SHA256 under a key derived from the master key, so the
+    manifest does not reveal whether a known file is in the backup, or which files are
+    identical. The master key's salt is kept in the manifest and reused by later runs,
+    so their MACs stay comparable. Call use_key before needs_update.
+
+    Args:
+        db_path (str): The path to the SQLite database. It is created if missing.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        self._conn.executescript(SCHEMA)
+        self._uncommitted = 0
+        self.content_key = None
+
+    def _meta(self, name):
+        row = self._conn.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def key_params(self):
+        """
+        Returns the master key parameters earlier runs used.
+
+        Returns:
+            tuple: (salt, iterations) to build the session MasterKey with. The salt is None
+            for a new manifest.
+        """
+        salt = self._meta('salt')
+        iterations = self._meta('iterations')
+        return salt, int(iterations) if iterations is not None else ITERATIONS
+
+    def use_key(self, master_key):
+        """
+        Sets the key content MACs are computed with, recording its parameters on first use.
+
+        Manifests written before content MACs were keyed have their bare SHA256 digests
+        cleared, so files whose mtime changed since are encrypted again.
+
+        Args:
+            master_key (MasterKey): The session master key, built from key_params().
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: If the manifest was written under a different password.
+        """
+        key = content_key(master_key)
+        check = hmac.new(key, b'manifest key check', hashlib.sha256).digest()
+        stored = self._meta('key_check')
+        if stored is None:
+            self._conn.execute('UPDATE files SET sha256 = ?', ('',))
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)',
+                [('salt', master_key.salt), ('iterations', str(master_key.iterations)), ('key_check', check)]
+            )
+            self._conn.commit()
+        elif not hmac.compare_digest(stored, check):
+            raise ValueError("The manifest was written with a different password")
+        self.content_key = key
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _row(self, path):
+        return self._conn.execute(
+            'SELECT size, mtime_ns, sha256, deleted_at FROM files WHERE path = ?', (path,)
+        ).fetchone()
+
+    def needs_update(self, path, file_path, stat):
+        """
+        Checks whether a plaintext file is new or has changed since it was last encrypted.
+
+        Size and mtime are compared first. When only the mtime moved, the content hash
+        decides, so files that were touched but not modified are not re-encrypted.
+
+        Args:
+            path (str): The file's path relative to the input folder.
+            file_path (str): The file's full path, used to hash it if needed.
+            stat (os.stat_result): The file's current stat.
+
+        Returns:
+            bool: True if the file must be encrypted.
+        """
+        row = self._row(path)
+        if row is None or row[3] is not None:
+            return True
+
+        size, mtime_ns, sha256, _ = row
+        if size != stat.st_size:
+            return True
+        if mtime_ns == stat.st_mtime_ns:
+            return False
+
+        if not hmac.compare_digest(hash_file(file_path, self.content_key), sha256):
+            return True
+
+        self._conn.execute('UPDATE files SET mtime_ns = ? WHERE path = ?', (stat.st_mtime_ns, path))
+        self._count_write()
+        return False
+
+    def record(self, path, size, mtime_ns, sha256, ciphertext):
+        """
+        Records that a plaintext file was encrypted.
+
+        Args:
+            path (str): The file's path relative to the input folder.
+            size (int): The plaintext size when it was encrypted.
+            mtime_ns (int): The plaintext mtime when it was encrypted.
+            sha256 (str): The plaintext's content MAC, from hash_file or encrypt_and_hash_file.
+            ciphertext (str): The ciphertext path relative to the encrypted folder.
+
+        Returns:
+            None
+        """
+        self._conn.execute(
+            'INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256, ciphertext, encrypted_at, deleted_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, NULL)',
+            (path, size, mtime_ns, sha256, ciphertext, time.time())
+        )
+        self._count_write()
+
+    def tombstone_missing(self, seen_paths):
+        """
+        Marks every live entry that was not seen in the current walk as deleted.
+
+        Args:
+            seen_paths (set): The relative paths found in the input folder this run.
+
+        Returns:
+            list: The relative ciphertext paths of the newly tombstoned entries.
+        """
+        rows = self._conn.execute('SELECT path, ciphertext FROM files WHERE deleted_at IS NULL').fetchall()
+        missing = [(path, ciphertext) for path, ciphertext in rows if path not in seen_paths]
+
+        now = time.time()
+        self._conn.executemany(
+            'UPDATE files SET deleted_at = ? WHERE path = ?', [(now, path) for path, _ in missing]
+        )
+        self._conn.commit()
+        return [ciphertext for _, ciphertext in missing]
+
+    def changed_since(self, timestamp):
+        """
+        Lists the ciphertexts written at or after a point in time.
+
+        Args:
+            timestamp (float): A Unix timestamp.
+
+        Returns:
+            set: The relative ciphertext paths of live entries encrypted since the timestamp.
+        """
+        rows = self._conn.execute(
+            'SELECT ciphertext FROM files WHERE deleted_at IS NULL AND encrypted_at >= ?', (timestamp,)
+        )
+        return {ciphertext for (ciphertext,) in rows}
+
+    def _count_write(self):
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_EVERY:
+            self._conn.commit()
+            self._uncommitted = 0
@@ -0,0 +1,266 @@
+# VuduVations Segmented AES-GCM Container
+# Author: S Halverson @vuduvations
+# License: BSD 3-Clause
+
+'''
+An alternative to the CBC container for large files that need integrity checks
+and random access. The plaintext is split into fixed-size segments and each one
+is sealed with AES-GCM on its own:
+
+    header      46 bytes  magic b'VVAS', version, KDF id and iterations,
+                          PBKDF2 salt, HKDF file salt, segment size
+    segment 0   segment size + 16-byte tag
+    ...
+    segment N   up to segment size + 16-byte tag
+    footer      36 bytes  plaintext length, segment count, footer tag, b'VVAX'
+
+Segment i uses the counter nonce i under a per-file key, and its associated
+data binds the header, its index and whether it is the last segment, so
+segments cannot be reordered, swapped between files or truncated away. Every
+segment but the last has the same size, so the footer index only needs the
+plaintext length and segment count to locate any byte range.
+'''
+
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from container import KDF_PBKDF2_SHA256, derive_file_key
+from work_pool import bounded_submit
+
+MAGIC = b'VVAS'
+FOOTER_MAGIC = b'VVAX'
+VERSION = 1
+SEGMENT_SIZE = 64 * 1024  # Default plaintext bytes per segment
+TAG_SIZE = 16
+HEADER = struct.Struct('>4sBBI16s16sI')
+FOOTER = struct.Struct('>QQ16s4s')
+INDEX = struct.Struct('>QQ')
+NONCE = struct.Struct('>IQ')
+SEGMENT_AAD = struct.Struct('>QB')
+FILE_KEY_INFO = b'vuduvations aes-gcm segmented file key v1'
+
+# Nonce domains keep the footer tag from ever sharing a nonce with a segment
+SEGMENT_DOMAIN = 0
+FOOTER_DOMAIN = 1
+
+def _seal_segment(aesgcm, header, index, is_last, data):
+    return aesgcm.encrypt(NONCE.pack(SEGMENT_DOMAIN, index), data, header + SEGMENT_AAD.pack(index, is_last))
+
+def _open_segment(aesgcm, header, index, is_last, data):
+    return aesgcm.decrypt(NONCE.pack(SEGMENT_DOMAIN, index), data, header + SEGMENT_AAD.pack(index, is_last))
+
+def encrypt_file_segmented(file_path, output_path, key, segment_size=SEGMENT_SIZE, workers=1):
+    """
+    Encrypts a file into the segmented AES-GCM container.
+
+    Segments are read in batches and sealed on a thread pool, so one large file
+    can use several cores. Memory use is bounded by the batch size.
+
+    Args:
+        file_path (str): The path to the file to be encrypted.
+        output_path (str): The path where the container will be written.
+        key (MasterKey): The session master key to derive the file key from.
+        segment_size (int): The number of plaintext bytes per segment.
+        workers (int): The number of threads sealing segments concurrently.
+
+    Returns:
+        int: The number of plaintext bytes encrypted.
+    """
+    file_salt = os.urandom(16)
+    aesgcm = AESGCM(derive_file_key(key.key, file_salt, FILE_KEY_INFO))
+    header = HEADER.pack(MAGIC, VERSION, KDF_PBKDF2_SHA256, key.iterations, key.salt, file_salt, segment_size)
+
+    plaintext_length = os.path.getsize(file_path)
+    segment_count = max(1, -(-plaintext_length // segment_size))
+    batch_size = max(1, workers) * 4
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+
+    with open(file_path, 'rb') as src, open(output_path, 'wb') as dst, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        dst.write(header)
+
+        for first in range(0, segment_count, batch_size):
+            indexes = range(first, min(first + batch_size, segment_count))
+            segments = [src.read(segment_size) for _ in indexes]
+            sealed = executor.map(
+                lambda i, data: _seal_segment(aesgcm, header, i, i == segment_count - 1, data),
+                indexes, segments
+            )
+            for data in sealed:
+                dst.write(data)
+
+        index = INDEX.pack(plaintext_length, segment_count)
+        tag = aesgcm.encrypt(NONCE.pack(FOOTER_DOMAIN, 0), b'', header + index)
+        dst.write(FOOTER.pack(plaintext_length, segment_count, tag, FOOTER_MAGIC))
+
+    return plaintext_length
+
+class SegmentedFile:
+    """
+    Random-access reader for a segmented AES-GCM container.
+
+    Opening the file authenticates the footer index, so truncation or a wrong password is
+    reported before any segment is decrypted. Reads only decrypt the segments they touch.
+
+    Args:
+        file_path (str): The path to the container.
+        keys (KeyRing): The key ring resolving the master key from the header salt.
+
+    Raises:
+        ValueError: If the file is not a segmented container, or it is truncated or corrupt.
+        cryptography.exceptions.InvalidTag: If the key is wrong or the footer was tampered with.
+    """
+
+    def __init__(self, file_path, keys):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        self._seek_lock = threading.Lock()  # Only used where os.pread is missing (Windows)
+        try:
+            self._load(keys)
+        except Exception:
+            self._file.close()
+            raise
+
+    def _load(self, keys):
+        self.header = self._file.read(HEADER.size)
+        if len(self.header) < HEADER.size or not self.header.startswith(MAGIC):
+            raise ValueError(f"Not a segmented container: '{self.file_path}'")
+
+        _, version, kdf, iterations, salt, file_salt, self.segment_size = HEADER.unpack(self.header)
+        if version != VERSION:
+            raise ValueError(f"Unsupported container version: {version}")
+        if kdf != KDF_PBKDF2_SHA256:
+            raise ValueError(f"Unsupported key derivation function: {kdf}")
+
+        file_size = os.fstat(self._file.fileno()).st_size
+        if file_size < HEADER.size + FOOTER.size:
+            raise ValueError(f"Truncated container: '{self.file_path}'")
+        self._file.seek(file_size - FOOTER.size)
+        self.length, self.segment_count, tag, footer_magic = FOOTER.unpack(self._file.read(FOOTER.size))
+        if footer_magic != FOOTER_MAGIC:
+            raise ValueError(f"Truncated container: '{self.file_path}'")
+
+        master_key = keys.master_key(salt, iterations)
+        self._aesgcm = AESGCM(derive_file_key(master_key, file_salt, FILE_KEY_INFO))
+        index = INDEX.pack(self.length, self.segment_count)
+        self._aesgcm.decrypt(NONCE.pack(FOOTER_DOMAIN, 0), tag, self.header + index)
+
+        expected = HEADER.size + self.length + self.segment_count * TAG_SIZE + FOOTER.size
+        if file_size != expected:
+            raise ValueError(f"Container size does not match its index: '{self.file_path}'")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_segment(self, index):
+        offset = HEADER.size + index * (self.segment_size + TAG_SIZE)
+        size = min(self.segment_size, self.length - index * self.segment_size) + TAG_SIZE
+        if hasattr(os, 'pread'):
+            return os.pread(self._file.fileno(), size, offset)
+        # Without pread, worker threads share the file position, so seek and read together
+        with self._seek_lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+    def decrypt_segment(self, index):
+        """
+        Reads and decrypts a single segment.
+
+        Args:
+            index (int): The segment number.
+
+        Returns:
+            bytes: The segment's plaintext.
+
+        Raises:
+            cryptography.exceptions.InvalidTag: If the segment is corrupt.
+        """
+        if not 0 <= index < self.segment_count:
+            raise IndexError(f"Segment {index} out of range")
+        is_last = index == self.segment_count - 1
+        return _open_segment(self._aesgcm, self.header, index, is_last, self._read_segment(index))
+
+    def read(self, offset, length):
+        """
+        Decrypts an arbitrary byte range of the plaintext.
+
+        Args:
+            offset (int): The plaintext offset to start at.
+            length (int): The number of bytes to read. Reads past the end are shortened.
+
+        Returns:
+            bytes: The plaintext in the range.
+        """
+        end = min(offset + length, self.length)
+        if offset >= end:
+            return b''
+
+        first = offset // self.segment_size
+        last = (end - 1) // self.segment_size
+        data = b''.join(self.decrypt_segment(i) for i in range(first, last + 1))
+        start = offset - first * self.segment_size
+        return data[start:start + end - offset]
+
+    def iter_segments(self, workers=1):
+        """
+        Decrypts every segment in order, several at a time on a thread pool.
+
+        Args:
+            workers (int): The number of threads decrypting segments concurrently.
+
+        Yields:
+            bytes: Each segment's plaintext, in order.
+        """
+        batch_size = max(1, workers) * 4
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for first in range(0, self.segment_count, batch_size):
+                indexes = range(first, min(first + batch_size, self.segment_count))
+                yield from executor.map(self.decrypt_segment, indexes)
+
+    def decrypt_to(self, output_path, workers=1):
+        """
+        Decrypts the whole container into a file.
+
+        Args:
+            output_path (str): The path where the plaintext will be written.
+            workers (int): The number of threads decrypting segments concurrently.
+
+        Returns:
+            int: The number of plaintext bytes written.
+        """
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        with open(output_path, 'wb') as dst:
+            for data in self.iter_segments(workers):
+                dst.write(data)
+        return self.length
+
+    def verify(self, workers=1):
+        """
+        Authenticates every segment without keeping any plaintext.
+
+        At most four segments per worker are queued at a time, so checking a huge
+        container never holds a future per segment.
+
+        Args:
+            workers (int): The number of threads checking segments concurrently.
+
+        Returns:
+            list: The indexes of segments that failed authentication, in order.
+        """
+        workers = max(1, workers)
+        jobs = ((self.segment_size, index, (index,)) for index in range(self.segment_count))
+        failed = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for index, future in bounded_submit(executor, self.decrypt_segment, jobs, workers * 4):
+                if future.exception() is not None:
+                    failed.append(index)
+        return sorted(failed)
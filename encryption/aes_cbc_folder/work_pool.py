@@ -0,0 +1,43 @@
+# VuduVations AES CBC Folder Work Pool
+# Author: S Halverson @vuduvations
+# License: BSD 3-Clause
+
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+
+MAX_INFLIGHT_BYTES = 256 * 1024 * 1024  # Default cap on bytes queued in a pool
+
+def bounded_submit(executor, fn, jobs, max_pending, max_inflight_bytes=MAX_INFLIGHT_BYTES):
+    """
+    Submits jobs to an executor while capping the queued work, yielding each job as it completes.
+
+    The jobs iterable is consumed lazily, so a directory walk feeding it overlaps with the
+    work already running in the pool instead of being materialised up front.
+
+    Args:
+        executor (concurrent.futures.Executor): The pool to run the jobs on.
+        fn (callable): The function to call as fn(*args) for each job.
+        jobs (iterable): (weight, tag, args) tuples, where weight is the job size in bytes.
+        max_pending (int): The maximum number of submitted jobs that have not finished yet.
+        max_inflight_bytes (int): The cap on the summed weight of unfinished jobs. A single job
+            larger than the cap still runs, on its own.
+
+    Yields:
+        tuple: (tag, future) for each finished job.
+    """
+    pending = {}
+    inflight_bytes = 0
+
+    for weight, tag, args in jobs:
+        while pending and (len(pending) >= max_pending or inflight_bytes + weight > max_inflight_bytes):
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                done_tag, done_weight = pending.pop(future)
+                inflight_bytes -= done_weight
+                yield done_tag, future
+
+        pending[executor.submit(fn, *args)] = (tag, weight)
+        inflight_bytes += weight
+
+    for future in as_completed(list(pending)):
+        done_tag, _ = pending.pop(future)
+        yield done_tag, future
@@ -1,6 +1,7 @@
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 from Crypto.Random import get_random_bytes
+from array import array
 
 def encrypt_data(data, key):
     # Create a new AES cipher
@@ -18,14 +19,54 @@ def decrypt_data(iv, ciphertext, key):
     pt = unpad(cipher.decrypt(ciphertext), AES.block_size).decode('utf-8')
     return pt
 
-# Example usage
-key = get_random_bytes(16)  # AES key must be either 16, 24, or 32 bytes long
-data = 'Hello World'
+# Function to encrypt many small records at once
+# Each record comes out as IV + ciphertext, as if encrypt_data had been called on it, but
+# the whole batch shares one key schedule and one contiguous output buffer. A random block
+# is fed through the CBC chain ahead of every record and its ciphertext becomes that
+# record's IV. Records may be str, encoded with encoding, or bytes.
+def encrypt_data_batch(records, key, encoding='utf-8'):
+    records = [r.encode(encoding) if isinstance(r, str) else r for r in records]
+    # Each slot holds the IV block followed by the padded record
+    offsets = array('Q', [0])
+    for record in records:
+        offsets.append(offsets[-1] + AES.block_size + (len(record) // AES.block_size + 1) * AES.block_size)
+    plaintext = bytearray(offsets[-1])
+    random_blocks = get_random_bytes(AES.block_size * len(records))
+    for i, record in enumerate(records):
+        start = offsets[i]
+        plaintext[start:start + AES.block_size] = random_blocks[AES.block_size * i:AES.block_size * (i + 1)]
+        plaintext[start + AES.block_size:offsets[i + 1]] = pad(record, AES.block_size)
+    # Encrypt the whole batch in a single pass into one preallocated buffer
+    buffer = bytearray(len(plaintext))
+    AES.new(key, AES.MODE_CBC).encrypt(plaintext, output=buffer)
+    return buffer, offsets
 
-# Encrypt the data
-iv, ciphertext = encrypt_data(data, key)
-print(f'Encrypted data: {ciphertext.hex()}')
+# Function to decrypt a batch produced by encrypt_data_batch
+# One CBC pass over the whole buffer recovers every record, since each block only depends
+# on the block before it; the blocks in the IV positions decrypt to noise and are skipped.
+# Returns bytes records, or str like decrypt_data when an encoding is given.
+def decrypt_data_batch(buffer, offsets, key, encoding=None):
+    padded = bytearray(len(buffer))
+    AES.new(key, AES.MODE_CBC, bytes(AES.block_size)).decrypt(buffer, output=padded)
+    plaintexts = []
+    for i in range(len(offsets) - 1):
+        record = unpad(padded[offsets[i] + AES.block_size:offsets[i + 1]], AES.block_size)
+        plaintexts.append(record.decode(encoding) if encoding else bytes(record))
+    return plaintexts
 
-# Decrypt the data
-plaintext = decrypt_data(iv, ciphertext, key)
-print(f'Decrypted message: {plaintext}')
+if __name__ == '__main__':
+    # Example usage
+    key = get_random_bytes(16)  # AES key must be either 16, 24, or 32 bytes long
+    data = 'Hello World'
+
+    # Encrypt the data
+    iv, ciphertext = encrypt_data(data, key)
+    print(f'Encrypted data: {ciphertext.hex()}')
+
+    # Decrypt the data
+    plaintext = decrypt_data(iv, ciphertext, key)
+    print(f'Decrypted message: {plaintext}')
+
+    # Encrypt many records in one batch
+    buffer, offsets = encrypt_data_batch(['record %d' % i for i in range(5)], key)
+    print(f'Batch decrypted: {decrypt_data_batch(buffer, offsets, key, encoding="utf-8")}')
@@ -1,6 +1,7 @@
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import padding
+from array import array
 import os
 
 # Function to encrypt data using AES
@@ -29,14 +30,69 @@ def aes_decrypt(key, iv, ciphertext):
     plaintext = unpadder.update(padded_plaintext) + unpadder.finalize()
     return plaintext
 
-# Example usage
-key = os.urandom(32)  # AES-256 key
-plaintext = b'Hello, world!'  # Plaintext message (must be bytes)
+# Function to encrypt many small records at once using AES
+# Each record comes out as IV + ciphertext, exactly as if aes_encrypt had been called on it,
+# but the whole batch shares one cipher context and one contiguous output buffer.
+# A random block is fed through the CBC chain ahead of every record; its ciphertext is
+# unpredictable and becomes that record's IV, so no per-record cipher setup is needed.
+def aes_encrypt_batch(key, records, encoding='utf-8'):
+    # Accept str as well as bytes records
+    records = [r.encode(encoding) if isinstance(r, str) else r for r in records]
+    # Each slot holds the IV block followed by the PKCS7-padded record
+    offsets = array('Q', [0])
+    for record in records:
+        offsets.append(offsets[-1] + 16 + (len(record) // 16 + 1) * 16)
+    plaintext = bytearray(offsets[-1])
+    random_blocks = os.urandom(16 * len(records))
+    for i, record in enumerate(records):
+        start = offsets[i]
+        plaintext[start:start + 16] = random_blocks[16 * i:16 * i + 16]
+        plaintext[start + 16:start + 16 + len(record)] = record
+        pad = offsets[i + 1] - start - 16 - len(record)
+        plaintext[offsets[i + 1] - pad:offsets[i + 1]] = bytes([pad]) * pad
+    # Encrypt the whole batch in a single pass into one preallocated buffer
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(os.urandom(16)), backend=default_backend()).encryptor()
+    buffer = bytearray(len(plaintext) + 15)
+    written = encryptor.update_into(plaintext, buffer)
+    encryptor.finalize()
+    del buffer[written:]
+    return buffer, offsets
 
-# Encrypt the plaintext
-iv, ciphertext = aes_encrypt(key, plaintext)
-print(f'Encrypted: {ciphertext}')
+# Function to decrypt a batch produced by aes_encrypt_batch
+# In CBC each block only depends on the block before it, so one decryptor over the whole
+# buffer recovers every record; the blocks sitting in the IV positions decrypt to noise
+# and are skipped. Returns bytes records like aes_decrypt, or str when an encoding is given.
+def aes_decrypt_batch(key, buffer, offsets, encoding=None):
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(b'\x00' * 16), backend=default_backend()).decryptor()
+    padded = bytearray(len(buffer) + 15)
+    written = decryptor.update_into(buffer, padded)
+    decryptor.finalize()
+    if written != len(buffer):
+        raise ValueError('The length of the provided data is not a multiple of the block length.')
+    plaintexts = []
+    for i in range(len(offsets) - 1):
+        record = padded[offsets[i] + 16:offsets[i + 1]]
+        # Unpad the record
+        pad = record[-1]
+        if not 1 <= pad <= 16 or record[-pad:] != bytes([pad]) * pad:
+            raise ValueError('Invalid padding bytes.')
+        plaintexts.append(record[:-pad].decode(encoding) if encoding else bytes(record[:-pad]))
+    return plaintexts
 
-# Decrypt the ciphertext
-decrypted_plaintext = aes_decrypt(key, iv, ciphertext)
-print(f'Decrypted: {decrypted_plaintext}')
+if __name__ == '__main__':
+    # Example usage
+    key = os.urandom(32)  # AES-256 key
+    plaintext = b'Hello, world!'  # Plaintext message (must be bytes)
+
+    # Encrypt the plaintext
+    iv, ciphertext = aes_encrypt(key, plaintext)
+    print(f'Encrypted: {ciphertext}')
+
+    # Decrypt the ciphertext
+    decrypted_plaintext = aes_decrypt(key, iv, ciphertext)
+    print(f'Decrypted: {decrypted_plaintext}')
+
+    # Encrypt many records in one batch
+    records = [b'log line %d' % i for i in range(5)]
+    buffer, offsets = aes_encrypt_batch(key, records)
+    print(f'Batch decrypted: {aes_decrypt_batch(key, buffer, offsets)}')
@@ -0,0 +1,280 @@
+# VuduVations Encryption Benchmark
+# Author: S Halverson @vuduvations
+# License: BSD 3-Clause
+
+'''
+Reproducible throughput benchmark for the folder and archive encryption code paths.
+
+Generates synthetic trees (many tiny files, a few huge files, or a mix) and measures
+encrypt_single_file, decrypt_folder, archives.CBC_AES_cryptography.aes_encrypt and
+archives.AES_CBC_pycryptodome.encrypt_data on each. Every case runs in a fresh process
+so its peak RSS is its own. Results are written as JSON and can be compared against an
+earlier run to flag regressions:
+
+    python benchmark.py --output today.json
+    python benchmark.py --output tomorrow.json --compare today.json --threshold 0.10
+'''
+
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'aes_cbc_folder'))
+sys.path.insert(0, os.path.join(HERE, 'archives'))
+
+PASSWORD = b'benchmark password'
+
+# name: list of (file count, min size, max size) groups
+PROFILES = {
+    'tiny': [(2000, 256, 4 * 1024)],
+    'huge': [(2, 64 * 1024 * 1024, 64 * 1024 * 1024)],
+    'mixed': [(500, 1024, 1024 * 1024), (1, 32 * 1024 * 1024, 32 * 1024 * 1024)],
+}
+
+TARGETS = ['encrypt_single_file', 'decrypt_folder', 'aes_encrypt', 'encrypt_data']
+
+def generate_tree(root, profile, scale=1.0, seed=0):
+    """
+    Writes a synthetic tree of base64 text files, spread over nested folders.
+
+    The content is text so the str-based archive helpers can consume it unchanged.
+
+    Args:
+        root (str): The folder to create the files in.
+        profile (str): A key of PROFILES.
+        scale (float): A multiplier on the file counts and sizes.
+        seed (int): The seed for file sizes, so runs are comparable.
+
+    Returns:
+        tuple: (file count, total bytes).
+    """
+    rng = random.Random(seed)
+    count = 0
+    total = 0
+    for group, (files, min_size, max_size) in enumerate(PROFILES[profile]):
+        for i in range(max(1, int(files * scale))):
+            size = max(1, int(rng.randint(min_size, max_size) * scale))
+            folder = os.path.join(root, f'g{group}', f'd{i % 16}')
+            os.makedirs(folder, exist_ok=True)
+            raw = os.urandom(size * 3 // 4 + 3)
+            with open(os.path.join(folder, f'f{i}.txt'), 'wb') as f:
+                f.write(base64.b64encode(raw)[:size])
+            count += 1
+            total += size
+    return count, total
+
+def iter_files(root):
+    for folder, _, files in os.walk(root):
+        for file in files:
+            yield os.path.join(folder, file)
+
+def peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+def time_kdf():
+    from container import derive_master_key
+
+    started = time.perf_counter()
+    derive_master_key(PASSWORD, os.urandom(16))
+    return time.perf_counter() - started
+
+def run_case(target, tree, workdir):
+    """
+    Runs one benchmark case. Meant to be called in a fresh worker process.
+
+    Setup such as copying or pre-encrypting the tree is not timed.
+
+    Args:
+        target (str): One of TARGETS.
+        tree (str): The synthetic plaintext tree.
+        workdir (str): A scratch folder for this case.
+
+    Returns:
+        dict: The measured seconds, files, bytes, peak RSS and KDF time.
+    """
+    files = list(iter_files(tree))
+    total = sum(os.path.getsize(path) for path in files)
+    kdf_seconds = time_kdf()
+
+    if target == 'encrypt_single_file':
+        from container import MasterKey
+        from folder_encryption import encrypt_single_file
+
+        copy = os.path.join(workdir, 'plain')
+        shutil.copytree(tree, copy)
+        paths = list(iter_files(copy))
+        # Silence the per-file progress lines so they are not part of the measurement
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            started = time.perf_counter()
+            key = MasterKey(PASSWORD)
+            for path in paths:
+                encrypt_single_file(path, PASSWORD, master_key=key)
+            seconds = time.perf_counter() - started
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    elif target == 'decrypt_folder':
+        from folder_decryption import decrypt_folder
+        from folder_encryption import encrypt_folder
+
+        encrypted = os.path.join(workdir, 'encrypted')
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            encrypt_folder(tree, encrypted, PASSWORD)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        started = time.perf_counter()
+        errors = decrypt_folder(encrypted, os.path.join(workdir, 'decrypted'), PASSWORD, progress_interval=None)
+        seconds = time.perf_counter() - started
+        if errors:
+            raise RuntimeError(f"decrypt_folder failed on {len(errors)} files")
+
+    elif target == 'aes_encrypt':
+        from CBC_AES_cryptography import aes_encrypt
+
+        key = os.urandom(32)
+        started = time.perf_counter()
+        for path in files:
+            with open(path, 'rb') as f:
+                aes_encrypt(key, f.read())
+        seconds = time.perf_counter() - started
+
+    elif target == 'encrypt_data':
+        from AES_CBC_pycryptodome import encrypt_data
+
+        key = os.urandom(32)
+        started = time.perf_counter()
+        for path in files:
+            with open(path, 'r') as f:
+                encrypt_data(f.read(), key)
+        seconds = time.perf_counter() - started
+
+    else:
+        raise ValueError(f"Unknown benchmark target: {target}")
+
+    return {
+        'files': len(files),
+        'bytes': total,
+        'seconds': seconds,
+        'mb_per_s': total / 1e6 / seconds if seconds else None,
+        'files_per_s': len(files) / seconds if seconds else None,
+        'peak_rss_kb': peak_rss_kb(),
+        'kdf_seconds': kdf_seconds,
+    }
+
+def run_benchmarks(profiles, targets, scale=1.0, repeat=1, workdir=None):
+    """
+    Runs every target against every profile, each case in a fresh process.
+
+    Args:
+        profiles (list): Keys of PROFILES.
+        targets (list): Entries of TARGETS.
+        scale (float): A multiplier on the profile file counts and sizes.
+        repeat (int): The number of runs per case. The fastest run is reported.
+        workdir (str): A scratch folder. A temporary one is used if omitted.
+
+    Returns:
+        dict: A JSON-serialisable report with run metadata and one result per case.
+    """
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'scale': scale,
+            'repeat': repeat,
+        },
+        'results': [],
+    }
+
+    base = tempfile.mkdtemp(prefix='vv_bench_', dir=workdir)
+    try:
+        for profile in profiles:
+            tree = os.path.join(base, profile, 'tree')
+            generate_tree(tree, profile, scale)
+
+            for target in targets:
+                runs = []
+                for attempt in range(repeat):
+                    case_dir = os.path.join(base, profile, f'{target}_{attempt}')
+                    os.makedirs(case_dir)
+                    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                        runs.append(executor.submit(run_case, target, tree, case_dir).result())
+                    shutil.rmtree(case_dir)
+
+                best = min(runs, key=lambda run: run['seconds'])
+                report['results'].append({'profile': profile, 'target': target, **best})
+                print(f"{profile:>6} {target:<20} {best['mb_per_s']:>9.1f} MB/s "
+                      f"{best['files_per_s']:>10.1f} files/s {best['peak_rss_kb'] / 1024:>8.1f} MB RSS")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    return report
+
+def compare(report, baseline, threshold=0.10):
+    """
+    Flags cases whose throughput dropped by more than the threshold against a baseline report.
+
+    Args:
+        report (dict): The current report.
+        baseline (dict): An earlier report.
+        threshold (float): The tolerated fractional drop in MB/s.
+
+    Returns:
+        list: (profile, target, baseline MB/s, current MB/s) for each regression.
+    """
+    previous = {(r['profile'], r['target']): r for r in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        before = previous.get((result['profile'], result['target']))
+        if before and before['mb_per_s'] and result['mb_per_s'] < before['mb_per_s'] * (1 - threshold):
+            regressions.append((result['profile'], result['target'], before['mb_per_s'], result['mb_per_s']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the folder and archive encryption code paths.')
+    parser.add_argument('--profiles', nargs='+', choices=sorted(PROFILES), default=sorted(PROFILES))
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=TARGETS)
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier on file counts and sizes')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per case; the fastest is reported')
+    parser.add_argument('--workdir', help='Scratch folder for the synthetic trees')
+    parser.add_argument('--output', help='Path to write the JSON report to')
+    parser.add_argument('--compare', help='Earlier JSON report to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Tolerated fractional MB/s drop')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.profiles, args.targets, args.scale, args.repeat, args.workdir)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for profile, target, before, after in regressions:
+            print(f"REGRESSION {profile} {target}: {before:.1f} -> {after:.1f} MB/s")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
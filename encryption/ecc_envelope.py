@@ -0,0 +1,237 @@
+'''
+Multi-recipient envelope encryption built on the ECDH + HKDF flow from
+elliptic_curve_cryptography.py.
+
+* Encrypt the payload once with AES-GCM under a random 32-byte data key.
+* Generate one ephemeral ECC key pair for the envelope.
+* For each recipient, derive a key-encryption key from ECDH(ephemeral, recipient) with HKDF
+  and use it to wrap only the data key.
+
+The cost grows with one ECDH per recipient, not with the payload size per recipient.
+Each recipient opens the envelope with their private key alone.
+'''
+
+import hashlib
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+MAGIC = b'VVEN'
+VERSION = 1
+KEY_ID_SIZE = 16
+NONCE_SIZE = 12
+TAG_SIZE = 16
+WRAPPED_KEY_SIZE = 32 + TAG_SIZE  # Data key plus GCM tag
+PAYLOAD_AAD = b'vuduvations envelope payload v1'
+WRAP_INFO = b'vuduvations envelope key wrap v1'
+HEADER = struct.Struct('>4sBH')
+COUNT = struct.Struct('>I')
+ENTRY_SIZE = KEY_ID_SIZE + NONCE_SIZE + WRAPPED_KEY_SIZE
+
+def public_key_bytes(public_key):
+    """
+    Serializes an ECC public key as an uncompressed X9.62 point.
+
+    Args:
+        public_key (EllipticCurvePublicKey): The key to serialize.
+
+    Returns:
+        bytes: The encoded point.
+    """
+    return public_key.public_bytes(
+        encoding=serialization.Encoding.X962,
+        format=serialization.PublicFormat.UncompressedPoint
+    )
+
+def key_id(public_key):
+    """
+    Computes the short identifier a recipient's entry is filed under.
+
+    Args:
+        public_key (EllipticCurvePublicKey): The recipient's public key.
+
+    Returns:
+        bytes: The first 16 bytes of the SHA256 of the encoded public key.
+    """
+    return hashlib.sha256(public_key_bytes(public_key)).digest()[:KEY_ID_SIZE]
+
+def _key_encryption_key(shared_secret, ephemeral_bytes, recipient_bytes):
+    # Binding both public keys ties each wrapped key to this envelope and this recipient
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=WRAP_INFO + ephemeral_bytes + recipient_bytes,
+        backend=default_backend()
+    ).derive(shared_secret)
+
+class Envelope:
+    """
+    A payload encrypted once for many recipients.
+
+    Args:
+        ephemeral_public (bytes): The envelope's ephemeral public key as an X9.62 point.
+        wrapped_keys (dict): (nonce, wrapped data key) tuples by recipient key id.
+        nonce (bytes): The payload's AES-GCM nonce.
+        ciphertext (bytes): The AES-GCM encrypted payload.
+    """
+
+    def __init__(self, ephemeral_public, wrapped_keys, nonce, ciphertext):
+        self.ephemeral_public = ephemeral_public
+        self.wrapped_keys = wrapped_keys
+        self.nonce = nonce
+        self.ciphertext = ciphertext
+
+    def to_bytes(self):
+        """
+        Serializes the envelope.
+
+        Returns:
+            bytes: The encoded envelope.
+        """
+        parts = [
+            HEADER.pack(MAGIC, VERSION, len(self.ephemeral_public)),
+            self.ephemeral_public,
+            COUNT.pack(len(self.wrapped_keys)),
+        ]
+        for recipient_id, (nonce, wrapped) in self.wrapped_keys.items():
+            parts.extend((recipient_id, nonce, wrapped))
+        parts.extend((self.nonce, self.ciphertext))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Parses a serialized envelope.
+
+        Args:
+            data (bytes): The encoded envelope.
+
+        Returns:
+            Envelope: The parsed envelope.
+
+        Raises:
+            ValueError: If the data is not a supported envelope, or is truncated.
+        """
+        view = memoryview(data)
+        if len(view) < HEADER.size:
+            raise ValueError("Envelope is truncated")
+        magic, version, public_size = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a supported envelope")
+
+        # An uncompressed X9.62 point is 0x04 followed by two equal-length coordinates
+        offset = HEADER.size
+        if public_size < 3 or public_size % 2 == 0:
+            raise ValueError(f"Invalid ephemeral public key length: {public_size}")
+        if len(view) < offset + public_size + COUNT.size:
+            raise ValueError("Envelope is truncated")
+        ephemeral_public = bytes(view[offset:offset + public_size])
+        if ephemeral_public[0] != 0x04:
+            raise ValueError("Ephemeral public key is not an uncompressed point")
+        offset += public_size
+        (count,) = COUNT.unpack_from(view, offset)
+        offset += COUNT.size
+
+        if len(view) - offset < count * ENTRY_SIZE + NONCE_SIZE + TAG_SIZE:
+            raise ValueError(f"Envelope is truncated: too short for {count} recipients and the payload")
+
+        wrapped_keys = {}
+        for _ in range(count):
+            entry = bytes(view[offset:offset + ENTRY_SIZE])
+            wrapped_keys[entry[:KEY_ID_SIZE]] = (
+                entry[KEY_ID_SIZE:KEY_ID_SIZE + NONCE_SIZE],
+                entry[KEY_ID_SIZE + NONCE_SIZE:],
+            )
+            offset += ENTRY_SIZE
+
+        nonce = bytes(view[offset:offset + NONCE_SIZE])
+        return cls(ephemeral_public, wrapped_keys, nonce, bytes(view[offset + NONCE_SIZE:]))
+
+def seal(payload, recipient_public_keys, workers=None):
+    """
+    Encrypts a payload once and wraps its data key for every recipient.
+
+    The recipients' ECDH exchanges and key wraps are spread over a thread pool. All
+    recipients must use the same curve.
+
+    Args:
+        payload (bytes): The data to encrypt.
+        recipient_public_keys (iterable): The recipients' EllipticCurvePublicKey objects.
+        workers (int): The number of threads wrapping keys. Defaults to the executor default.
+
+    Returns:
+        Envelope: The sealed envelope.
+
+    Raises:
+        ValueError: If the recipients do not all use the same curve.
+    """
+    recipients = list(recipient_public_keys)
+    curves = {type(public_key.curve) for public_key in recipients}
+    if len(curves) > 1:
+        raise ValueError("All recipients must use the same curve")
+    curve = recipients[0].curve if recipients else ec.SECP384R1()
+
+    data_key = AESGCM.generate_key(bit_length=256)
+    nonce = os.urandom(NONCE_SIZE)
+    ciphertext = AESGCM(data_key).encrypt(nonce, payload, PAYLOAD_AAD)
+
+    ephemeral_key = ec.generate_private_key(curve, default_backend())
+    ephemeral_bytes = public_key_bytes(ephemeral_key.public_key())
+
+    def wrap(public_key):
+        recipient_bytes = public_key_bytes(public_key)
+        shared_secret = ephemeral_key.exchange(ec.ECDH(), public_key)
+        kek = _key_encryption_key(shared_secret, ephemeral_bytes, recipient_bytes)
+        wrap_nonce = os.urandom(NONCE_SIZE)
+        recipient_id = hashlib.sha256(recipient_bytes).digest()[:KEY_ID_SIZE]
+        return recipient_id, (wrap_nonce, AESGCM(kek).encrypt(wrap_nonce, data_key, ephemeral_bytes))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        wrapped_keys = dict(executor.map(wrap, recipients))
+
+    return Envelope(ephemeral_bytes, wrapped_keys, nonce, ciphertext)
+
+def open_envelope(envelope, private_key):
+    """
+    Decrypts an envelope with one recipient's private key.
+
+    Args:
+        envelope (Envelope): The sealed envelope.
+        private_key (EllipticCurvePrivateKey): The recipient's private key.
+
+    Returns:
+        bytes: The payload.
+
+    Raises:
+        KeyError: If the envelope was not sealed for this key.
+        cryptography.exceptions.InvalidTag: If the envelope was tampered with.
+    """
+    public_key = private_key.public_key()
+    recipient_bytes = public_key_bytes(public_key)
+    wrap_nonce, wrapped = envelope.wrapped_keys[hashlib.sha256(recipient_bytes).digest()[:KEY_ID_SIZE]]
+
+    ephemeral_public = ec.EllipticCurvePublicKey.from_encoded_point(public_key.curve, envelope.ephemeral_public)
+    shared_secret = private_key.exchange(ec.ECDH(), ephemeral_public)
+    kek = _key_encryption_key(shared_secret, envelope.ephemeral_public, recipient_bytes)
+    data_key = AESGCM(kek).decrypt(wrap_nonce, wrapped, envelope.ephemeral_public)
+
+    return AESGCM(data_key).decrypt(envelope.nonce, envelope.ciphertext, PAYLOAD_AAD)
+
+if __name__ == '__main__':
+    # Example usage: one payload, many recipients
+    recipients = [ec.generate_private_key(ec.SECP384R1(), default_backend()) for _ in range(100)]
+    payload = os.urandom(1024 * 1024)
+
+    envelope = seal(payload, [key.public_key() for key in recipients])
+    data = envelope.to_bytes()
+    print(f"Envelope size: {len(data)} bytes for {len(recipients)} recipients")
+
+    decrypted = open_envelope(Envelope.from_bytes(data), recipients[42])
+    print(f"Recipient 42 decrypted the payload: {decrypted == payload}")
@@ -0,0 +1,238 @@
+'''
+A reusable AES-GCM session for high message rates, built on the ECDH + HKDF
+handshake from elliptic_curve_cryptography.py.
+
+* Run ECDH and HKDF once per session to derive one key per direction. Each side
+  also sends a fresh session random, mixed into the HKDF salt, so every session
+  gets new keys even when the same key pairs are used again.
+* Keep the AESGCM instances, so each message costs a single AEAD call.
+* Use a per-direction message counter as the nonce, so nonces never repeat.
+* Ratchet each direction's key forward with HKDF every `rekey_after` messages,
+  well before the AES-GCM usage limits for a single key are reached.
+
+Every message is the 8-byte big-endian counter followed by the ciphertext and tag.
+Receivers reject counters they have already seen or that went backwards.
+'''
+
+import os
+import struct
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from key_agreement import exchange, public_bytes
+
+HANDSHAKE_INFO = b'vuduvations session handshake v1'
+REKEY_INFO = b'vuduvations session rekey v1'
+REKEY_AFTER = 2 ** 24  # Messages per key, in line with the TLS 1.3 AES-GCM guidance
+COUNTER = struct.Struct('>Q')
+NONCE = struct.Struct('>IQ')
+TAG_SIZE = 16  # AES-GCM tag
+MAX_COUNTER = 2 ** 64 - 1
+MAX_EPOCH_SKIP = 1024  # Ratchet steps a single received message may trigger
+RANDOM_SIZE = 32
+
+def session_random():
+    """
+    Generates this side's session random, to be sent to the peer along with the public key.
+
+    Returns:
+        bytes: RANDOM_SIZE random bytes. Never reuse them for a second session.
+    """
+    return os.urandom(RANDOM_SIZE)
+
+def _hkdf(secret, length, info, salt=None):
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=length,
+        salt=salt,
+        info=info,
+        backend=default_backend()
+    ).derive(secret)
+
+class _Direction:
+    """One direction of a session: its key ratchet, current AEAD instance and counter."""
+
+    def __init__(self, key, rekey_after):
+        self.key = key
+        self.rekey_after = rekey_after
+        self.epoch = 0
+        self.aead = AESGCM(key)
+        self.counter = 0
+
+    def aead_for(self, counter):
+        """
+        Returns the AEAD instance for a counter without advancing the ratchet.
+
+        Returns:
+            tuple: (aead, epoch, key), to be passed to advance once the message is accepted.
+        """
+        # Counters only move forward, so the ratchet only ever steps ahead
+        epoch = counter // self.rekey_after
+        if epoch == self.epoch:
+            return self.aead, self.epoch, self.key
+        if epoch - self.epoch > MAX_EPOCH_SKIP:
+            raise ValueError(f"Message counter {counter} is too far ahead of the session")
+
+        key = self.key
+        for _ in range(epoch - self.epoch):
+            key = _hkdf(key, 32, REKEY_INFO)
+        return AESGCM(key), epoch, key
+
+    def advance(self, aead, epoch, key):
+        self.aead, self.epoch, self.key = aead, epoch, key
+
+class SecureSession:
+    """
+    An established AES-GCM session between two parties.
+
+    Both sides build the session from their own private key and the peer's public key;
+    exactly one of them passes initiator=True. Each side also generates a session_random()
+    and sends it to the peer with its public key. Both randoms go into the key derivation,
+    so sessions between the same key pairs never share keys and counter nonces never
+    repeat under one key. Keys may be long-lived or ephemeral, on a NIST curve or X25519;
+    a key_agreement.EphemeralKeyPool keeps key generation off the handshake path. Sessions
+    are not thread-safe; use one per connection or guard it with a lock.
+
+    Args:
+        private_key (object): This side's EllipticCurvePrivateKey or X25519PrivateKey.
+        peer_public_key (object): The other side's matching public key.
+        initiator (bool): Whether this side initiated the session.
+        own_random (bytes): This side's session_random(), fresh for this session.
+        peer_random (bytes): The session random received from the peer.
+        rekey_after (int): The number of messages sent under each key before ratcheting.
+
+    Raises:
+        ValueError: If a session random has the wrong length, or the two are equal.
+    """
+
+    def __init__(self, private_key, peer_public_key, initiator, own_random, peer_random,
+                 rekey_after=REKEY_AFTER):
+        if len(own_random) != RANDOM_SIZE or len(peer_random) != RANDOM_SIZE:
+            raise ValueError(f"Session randoms must be {RANDOM_SIZE} bytes")
+        if own_random == peer_random:
+            raise ValueError("Peer session random equals our own; it was reflected or reused")
+        shared_secret = exchange(private_key, peer_public_key)
+
+        # Bind both public keys and both randoms in a fixed order so the two sides derive the same keys
+        own = public_bytes(private_key.public_key())
+        peer = public_bytes(peer_public_key)
+        initiator_key, responder_key = (own, peer) if initiator else (peer, own)
+        initiator_random, responder_random = (own_random, peer_random) if initiator else (peer_random, own_random)
+        keys = _hkdf(shared_secret, 64, HANDSHAKE_INFO + initiator_key + responder_key,
+                     salt=initiator_random + responder_random)
+
+        send_key, receive_key = (keys[:32], keys[32:]) if initiator else (keys[32:], keys[:32])
+        self._send = _Direction(send_key, rekey_after)
+        self._receive = _Direction(receive_key, rekey_after)
+        self._last_received = -1
+
+    def encrypt(self, data, associated_data=None):
+        """
+        Encrypts one message.
+
+        Args:
+            data (bytes-like): The plaintext. A memoryview is used without copying.
+            associated_data (bytes): Data to authenticate but not encrypt, if any.
+
+        Returns:
+            bytes: The counter followed by the ciphertext and tag.
+
+        Raises:
+            OverflowError: If the session has sent 2**64 messages.
+        """
+        counter = self._send.counter
+        if counter >= MAX_COUNTER:
+            raise OverflowError("Session message counter exhausted; start a new session")
+        self._send.counter = counter + 1
+
+        aead, epoch, key = self._send.aead_for(counter)
+        self._send.advance(aead, epoch, key)
+        return COUNTER.pack(counter) + aead.encrypt(NONCE.pack(0, counter), data, associated_data)
+
+    def decrypt(self, message, associated_data=None):
+        """
+        Decrypts one message.
+
+        Args:
+            message (bytes-like): The counter followed by the ciphertext and tag.
+            associated_data (bytes): The associated data given to encrypt, if any.
+
+        Returns:
+            bytes: The plaintext.
+
+        Raises:
+            ValueError: If the message is too short, a replay, arrived out of order or is
+                implausibly far ahead.
+            cryptography.exceptions.InvalidTag: If the message was tampered with.
+        """
+        view = memoryview(message)
+        if len(view) < COUNTER.size + TAG_SIZE:
+            raise ValueError(f"Message too short: {len(view)} bytes")
+        (counter,) = COUNTER.unpack_from(view)
+        if counter <= self._last_received:
+            raise ValueError(f"Replayed or reordered message: counter {counter}")
+
+        # Only move the ratchet once the message authenticates, so forged counters cannot desync it
+        aead, epoch, key = self._receive.aead_for(counter)
+        plaintext = aead.decrypt(NONCE.pack(0, counter), view[COUNTER.size:], associated_data)
+        self._receive.advance(aead, epoch, key)
+        self._last_received = counter
+        return plaintext
+
+    def encrypt_many(self, messages, associated_data=None):
+        """
+        Encrypts a batch of messages.
+
+        Args:
+            messages (iterable): Bytes-like plaintexts. Memoryviews are used without copying.
+            associated_data (bytes): Data to authenticate with every message, if any.
+
+        Returns:
+            list: The encrypted messages, in order.
+        """
+        encrypt = self.encrypt
+        return [encrypt(data, associated_data) for data in messages]
+
+    def decrypt_many(self, messages, associated_data=None):
+        """
+        Decrypts a batch of messages.
+
+        Args:
+            messages (iterable): Encrypted messages, in the order they were sent.
+            associated_data (bytes): The associated data given to encrypt_many, if any.
+
+        Returns:
+            list: The plaintexts, in order.
+        """
+        decrypt = self.decrypt
+        return [decrypt(message, associated_data) for message in messages]
+
+if __name__ == '__main__':
+    import time
+
+    # Example usage: both parties swap public keys and session randoms, derive the session once,
+    # then exchange messages
+    alice_key = ec.generate_private_key(ec.SECP384R1(), default_backend())
+    bob_key = ec.generate_private_key(ec.SECP384R1(), default_backend())
+    alice_random, bob_random = session_random(), session_random()
+    alice = SecureSession(alice_key, bob_key.public_key(), True, alice_random, bob_random)
+    bob = SecureSession(bob_key, alice_key.public_key(), False, bob_random, alice_random)
+
+    print(f"Bob received: {bob.decrypt(alice.encrypt(b'A secret message'))}")
+
+    # A second session between the same key pairs gets new keys, so counter 0 is never reused under one key
+    again = SecureSession(alice_key, bob_key.public_key(), True, session_random(), session_random())
+    first = SecureSession(alice_key, bob_key.public_key(), True, alice_random, bob_random)
+    reused = again.encrypt(b'A secret message') == first.encrypt(b'A secret message')
+    print(f"New session randoms give a different ciphertext for counter 0: {not reused}")
+
+    messages = [memoryview(b'x' * 256)] * 100000
+    started = time.perf_counter()
+    encrypted = alice.encrypt_many(messages)
+    elapsed = time.perf_counter() - started
+    bob.decrypt_many(encrypted)
+    print(f"Encrypted {len(messages)} messages at {elapsed / len(messages) * 1e6:.2f} us each")
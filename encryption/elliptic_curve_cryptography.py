@@ -44,8 +44,10 @@ derived_key = HKDF(
 # In practice, you'd use this derived key with a symmetric cipher like AES
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
+import os
+
 aesgcm = AESGCM(derived_key)
-nonce = b'\x00' * 12  # In practice, use a unique nonce for each message
+nonce = os.urandom(12)  # Never reuse a nonce with the same key; see ecc_session.py for counter nonces
 plaintext = b'A secret message'
 ciphertext = aesgcm.encrypt(nonce, plaintext, None)
 decryptedtext = aesgcm.decrypt(nonce, ciphertext, None)
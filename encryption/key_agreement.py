@@ -0,0 +1,258 @@
+'''
+Key agreement helpers for the ECC flows, with an optional X25519 fast path
+and a background pool of ephemeral key pairs.
+
+* `generate_keypair`, `exchange` and `public_bytes` work the same for the NIST
+  curves used in elliptic_curve_cryptography.py and for X25519.
+* `EphemeralKeyPool` keeps a pre-filled, thread-safe queue of key pairs and
+  refills it on a background thread, so handshakes take a ready key instead of
+  paying for key generation on the request path.
+* Running this module benchmarks handshakes per second across curves, with and
+  without the pool. The pool moves key generation off the request path, which
+  lowers the median latency, but the refill still costs CPU. Throughput only
+  improves when a spare core runs the refill thread.
+'''
+
+import queue
+import statistics
+import threading
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, x25519
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+CURVES = {
+    'secp384r1': ec.SECP384R1,
+    'secp256r1': ec.SECP256R1,
+    'x25519': None,
+}
+DEFAULT_CURVE = 'secp384r1'
+POOL_SIZE = 256
+HANDSHAKE_INFO = b'vuduvations key agreement v1'
+
+def generate_keypair(curve=DEFAULT_CURVE):
+    """
+    Generates a private key on the named curve.
+
+    Args:
+        curve (str): A key of CURVES.
+
+    Returns:
+        object: An EllipticCurvePrivateKey or X25519PrivateKey.
+    """
+    if curve == 'x25519':
+        return x25519.X25519PrivateKey.generate()
+    return ec.generate_private_key(CURVES[curve](), default_backend())
+
+def exchange(private_key, peer_public_key):
+    """
+    Computes the raw shared secret between a private key and a peer's public key.
+
+    Args:
+        private_key (object): An EllipticCurvePrivateKey or X25519PrivateKey.
+        peer_public_key (object): The matching kind of public key.
+
+    Returns:
+        bytes: The shared secret.
+    """
+    if isinstance(private_key, x25519.X25519PrivateKey):
+        return private_key.exchange(peer_public_key)
+    return private_key.exchange(ec.ECDH(), peer_public_key)
+
+def public_bytes(public_key):
+    """
+    Serializes a public key compactly: an uncompressed point for NIST curves, 32 raw bytes for X25519.
+
+    Args:
+        public_key (object): An EllipticCurvePublicKey or X25519PublicKey.
+
+    Returns:
+        bytes: The encoded key.
+    """
+    if isinstance(public_key, x25519.X25519PublicKey):
+        return public_key.public_bytes(encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw)
+    return public_key.public_bytes(
+        encoding=serialization.Encoding.X962,
+        format=serialization.PublicFormat.UncompressedPoint
+    )
+
+def load_public_key(curve, data):
+    """
+    Parses a public key produced by public_bytes.
+
+    Args:
+        curve (str): A key of CURVES.
+        data (bytes): The encoded key.
+
+    Returns:
+        object: An EllipticCurvePublicKey or X25519PublicKey.
+    """
+    if curve == 'x25519':
+        return x25519.X25519PublicKey.from_public_bytes(data)
+    return ec.EllipticCurvePublicKey.from_encoded_point(CURVES[curve](), data)
+
+def derive_shared_key(private_key, peer_public_key, info=HANDSHAKE_INFO, length=32):
+    """
+    Runs the key exchange and derives a symmetric key from it with HKDF-SHA256.
+
+    Args:
+        private_key (object): This side's private key.
+        peer_public_key (object): The peer's public key.
+        info (bytes): The HKDF context.
+        length (int): The derived key length in bytes.
+
+    Returns:
+        bytes: The derived key.
+    """
+    return HKDF(
+        algorithm=hashes.SHA256(),
+        length=length,
+        salt=None,
+        info=info,
+        backend=default_backend()
+    ).derive(exchange(private_key, peer_public_key))
+
+class EphemeralKeyPool:
+    """
+    A pre-filled, thread-safe pool of ephemeral private keys refilled on a background thread.
+
+    acquire() hands out each key exactly once. When the pool runs dry it generates a key
+    inline rather than blocking, so a burst degrades to the unpooled cost instead of stalling.
+    The refill thread only wakes once the pool drops below low_water, and then tops it up
+    completely, so it works in batches instead of competing with every handshake.
+
+    Args:
+        curve (str): A key of CURVES.
+        size (int): The number of keys kept ready.
+        low_water (int): The pool level that triggers a refill. Defaults to a quarter of size.
+    """
+
+    def __init__(self, curve=DEFAULT_CURVE, size=POOL_SIZE, low_water=None):
+        self.curve = curve
+        self.size = size
+        self.low_water = size // 4 if low_water is None else low_water
+        self.misses = 0
+        self._keys = queue.Queue(maxsize=size)
+        self._wanted = threading.Event()
+        self._closed = threading.Event()
+        self._wanted.set()
+        self._thread = threading.Thread(target=self._refill, name=f'key-pool-{curve}', daemon=True)
+        self._thread.start()
+
+    def _refill(self):
+        while not self._closed.is_set():
+            self._wanted.wait()
+            while not self._closed.is_set() and not self._keys.full():
+                self._keys.put(generate_keypair(self.curve))
+            self._wanted.clear()
+            # A key taken between the fill loop and clear() must not leave the pool short
+            if self._keys.qsize() < self.low_water:
+                self._wanted.set()
+
+    def acquire(self):
+        """
+        Takes a fresh ephemeral private key from the pool.
+
+        Returns:
+            object: A private key that no other caller has received.
+        """
+        try:
+            key = self._keys.get_nowait()
+        except queue.Empty:
+            self.misses += 1
+            key = generate_keypair(self.curve)
+        if self._keys.qsize() < self.low_water:
+            self._wanted.set()
+        return key
+
+    def fill(self, timeout=None):
+        """
+        Waits until the pool is full, for example before taking traffic.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait, or None to wait indefinitely.
+
+        Returns:
+            bool: True if the pool is full.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._keys.full():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def close(self):
+        """Stops the refill thread."""
+        self._closed.set()
+        self._wanted.set()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def benchmark(curves=tuple(CURVES), handshakes=2000, pooled=False, pool_size=POOL_SIZE):
+    """
+    Measures server-side handshakes: one ephemeral key plus one exchange and HKDF per handshake.
+
+    The pooled run measures the steady state rather than a pre-filled pool. A pool far
+    smaller than the run is filled, then drained once untimed, so every timed handshake
+    competes with the refill thread and every key was generated during the run. The time
+    taken to fill the pool is reported separately as the per-key refill cost.
+
+    Args:
+        curves (iterable): Keys of CURVES to measure.
+        handshakes (int): The number of timed handshakes per curve.
+        pooled (bool): Take ephemeral keys from an EphemeralKeyPool.
+        pool_size (int): The pool size for pooled runs.
+
+    Returns:
+        dict: Per curve, handshakes per second and the p50 and p99 latency in microseconds.
+        Pooled runs add the refill cost per key in microseconds and the pool misses.
+    """
+    results = {}
+    for curve in curves:
+        peer_public_key = generate_keypair(curve).public_key()
+        filling = time.perf_counter()
+        pool = EphemeralKeyPool(curve, size=pool_size) if pooled else None
+        if pool:
+            pool.fill()
+            refill_seconds = (time.perf_counter() - filling) / pool_size
+            # Drain the pre-filled keys so the timed run only sees keys refilled under load
+            for _ in range(pool_size):
+                derive_shared_key(pool.acquire(), peer_public_key)
+            pool.misses = 0
+
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(handshakes):
+            begin = time.perf_counter()
+            private_key = pool.acquire() if pool else generate_keypair(curve)
+            derive_shared_key(private_key, peer_public_key)
+            latencies.append(time.perf_counter() - begin)
+        elapsed = time.perf_counter() - started
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        results[curve] = {
+            'handshakes_per_s': handshakes / elapsed,
+            'p50_us': quantiles[49] * 1e6,
+            'p99_us': quantiles[98] * 1e6,
+        }
+        if pool:
+            pool.close()
+            results[curve].update(refill_us_per_key=refill_seconds * 1e6, misses=pool.misses)
+    return results
+
+if __name__ == '__main__':
+    for pooled in (False, True):
+        for curve, result in benchmark(pooled=pooled).items():
+            refill = (f"  refill {result['refill_us_per_key']:>7.1f} us/key  {result['misses']} misses"
+                      if pooled else '')
+            print(f"{curve:<10} {'pooled' if pooled else 'inline':<7} "
+                  f"{result['handshakes_per_s']:>9.0f} handshakes/s  "
+                  f"p50 {result['p50_us']:>7.1f} us  p99 {result['p99_us']:>7.1f} us{refill}")
@@ -0,0 +1,231 @@
+# VuduVations Instrumentation
+# Author: S Halverson @vuduvations
+# License: BSD 3-Clause
+
+'''
+Opt-in timers, counters and latency histograms for the hot paths.
+
+Shared by the CBA tool and the AES-CBC folder tool, which add the repository
+root to sys.path to import it, so both write the same formats.
+
+Instrumentation is off by default and each instrumented call then costs one flag
+check. Turn it on in code with enable(), or for a whole run by setting
+VV_METRICS to an output path prefix:
+
+    VV_METRICS=/tmp/vv_metrics python encryption/aes_cbc_folder/folder_decryption.py
+    VV_METRICS=/tmp/vv_metrics python CBA/cyberchoicesmb.py
+
+At exit this writes /tmp/vv_metrics.json, a JSON summary, and /tmp/vv_metrics.prom,
+in the Prometheus text format for a local scraper or node_exporter's textfile
+collector. dump() writes the same files on demand.
+
+Every timed operation records `<name>_seconds` (a latency histogram),
+`<name>_calls_total`, `<name>_errors_total` and, where it has a size,
+`<name>_bytes_total`. Metrics cover the current process: work in thread pools is
+included, work in process pools is not.
+'''
+
+import atexit
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+METRICS_ENV = 'VV_METRICS'
+PREFIX = 'vv_'
+# Latency bucket upper bounds in seconds
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_enabled = False
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}  # name: [per-bucket counts plus overflow, sum, count]
+
+def enabled():
+    """Returns whether instrumentation is on."""
+    return _enabled
+
+def enable(output=None):
+    """
+    Turns instrumentation on.
+
+    Args:
+        output (str): A path prefix to dump the metrics to at exit, if any.
+
+    Returns:
+        None
+    """
+    global _enabled
+    _enabled = True
+    if output:
+        atexit.register(dump, output)
+
+def disable():
+    """Turns instrumentation off. Recorded metrics are kept."""
+    global _enabled
+    _enabled = False
+
+def reset():
+    """Discards all recorded metrics."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def count(name, value=1):
+    """
+    Adds to a counter, if instrumentation is on.
+
+    Args:
+        name (str): The counter name, e.g. 'decrypt_file_errors_total'.
+        value (float): The amount to add.
+
+    Returns:
+        None
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def observe(name, seconds):
+    """
+    Records a latency in a histogram, if instrumentation is on.
+
+    Args:
+        name (str): The histogram name, e.g. 'decrypt_file_seconds'.
+        seconds (float): The observed latency.
+
+    Returns:
+        None
+    """
+    if not _enabled:
+        return
+    index = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        histogram[0][index] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+def timed(name, size=None):
+    """
+    Decorates a function to record its latency, calls, errors and optionally bytes.
+
+    Args:
+        name (str): The operation name the metrics are prefixed with.
+        size (callable): Called as size(result, *args, **kwargs) after a successful call
+            to return the number of bytes processed, if any.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                count(f'{name}_errors_total')
+                raise
+            finally:
+                observe(f'{name}_seconds', time.perf_counter() - started)
+                count(f'{name}_calls_total')
+            if size is not None:
+                count(f'{name}_bytes_total', size(result, *args, **kwargs) or 0)
+            return result
+        return wrapper
+    return decorator
+
+def returned_size(result, *args, **kwargs):
+    """A size callable for timed() when the function returns its byte count."""
+    return result
+
+def snapshot():
+    """
+    Returns the recorded metrics.
+
+    Returns:
+        dict: 'counters' by name, and 'histograms' by name with their buckets, sum,
+        count, mean and approximate p50/p90/p99 (bucket upper bounds).
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {name: (list(buckets), total, calls) for name, (buckets, total, calls) in _histograms.items()}
+
+    summary = {'counters': counters, 'histograms': {}}
+    for name, (buckets, total, calls) in histograms.items():
+        bounds = list(BUCKETS) + [float('inf')]
+        quantiles = {}
+        for q in (0.5, 0.9, 0.99):
+            seen = 0
+            for bound, bucket in zip(bounds, buckets):
+                seen += bucket
+                if seen >= q * calls:
+                    quantiles[f'p{int(q * 100)}'] = bound
+                    break
+        summary['histograms'][name] = {
+            'buckets': {str(bound): bucket for bound, bucket in zip(bounds, buckets)},
+            'sum': total,
+            'count': calls,
+            'mean': total / calls if calls else None,
+            **quantiles,
+        }
+    return summary
+
+def prometheus_text(metrics=None):
+    """
+    Formats metrics in the Prometheus text exposition format.
+
+    Args:
+        metrics (dict): A snapshot() result. Defaults to the current metrics.
+
+    Returns:
+        str: The exposition text.
+    """
+    metrics = metrics or snapshot()
+    lines = []
+    for name, value in sorted(metrics['counters'].items()):
+        lines.append(f'# TYPE {PREFIX}{name} counter')
+        lines.append(f'{PREFIX}{name} {value}')
+    for name, histogram in sorted(metrics['histograms'].items()):
+        lines.append(f'# TYPE {PREFIX}{name} histogram')
+        cumulative = 0
+        for bound, bucket in histogram['buckets'].items():
+            cumulative += bucket
+            le = '+Inf' if bound == 'inf' else bound
+            lines.append(f'{PREFIX}{name}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f'{PREFIX}{name}_sum {histogram["sum"]}')
+        lines.append(f'{PREFIX}{name}_count {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+def _write(path, text):
+    # Scrapers must never read a half-written file
+    temp_path = f'{path}.tmp{os.getpid()}'
+    with open(temp_path, 'w') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+def dump(prefix):
+    """
+    Writes the metrics to `<prefix>.json` and `<prefix>.prom`.
+
+    Args:
+        prefix (str): The output path prefix.
+
+    Returns:
+        dict: The snapshot that was written.
+    """
+    metrics = snapshot()
+    _write(f'{prefix}.json', json.dumps(metrics, indent=2))
+    _write(f'{prefix}.prom', prometheus_text(metrics))
+    return metrics
+
+if os.environ.get(METRICS_ENV):
+    enable(os.environ[METRICS_ENV])